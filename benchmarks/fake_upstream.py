@@ -0,0 +1,222 @@
+"""
+Local stand-in for Open-Meteo and Nominatim.
+
+Serves the two upstream calls the system makes, with synthetic but plausible
+answers, so the clients and the server can be profiled without network
+access or third-party latency:
+
+    GET /v1/forecast?latitude=..&longitude=..&current_weather=true
+        current weather per coordinate (comma-separated lists give a list
+        of results, as Open-Meteo does). Values are deterministic for a
+        location and 15-minute slot: temperature follows latitude and the
+        local time of day, wind and weather code come from a seeded RNG.
+    GET /reverse?lat=..&lon=..&format=json
+        a Nominatim-style address for the nearest place in gazetteer.csv,
+        or {"error": "Unable to geocode"} far from any place.
+
+Degradation can be injected on every request: a fixed plus jittered delay, a
+share of HTTP errors (500/502/503/429) and a share of requests that hang
+until the client times out.
+
+Run from the repository root, then point the system at it:
+    python -m benchmarks.fake_upstream --port 8090 --latency 50 --jitter 100 --error-rate 0.02
+    OPEN_METEO_URL=http://127.0.0.1:8090/v1/forecast python station_agent.py --once
+    NOMINATIM_URL=http://127.0.0.1:8090/reverse NOMINATIM_RATE_LIMIT=0 GEOCODER_MODE=online python ingest.py
+"""
+import argparse
+import json
+import math
+import random
+import threading
+import time
+import zlib
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from geocoding import get_offline_geocoder
+
+# Open-Meteo refreshes current_weather every 15 minutes
+UPDATE_INTERVAL = 900
+
+# Beyond this distance from any gazetteer place, reverse lookups find nothing
+MAX_PLACE_DISTANCE_KM = 200
+
+# WMO weather codes and how often each one is picked
+WEATHER_CODES = (0, 1, 2, 3, 45, 51, 61, 63, 80, 95)
+WEATHER_WEIGHTS = (30, 20, 15, 12, 3, 5, 6, 3, 4, 2)
+
+ERROR_STATUSES = (500, 502, 503, 429)
+
+
+def synthetic_weather(latitude, longitude, slot):
+    """current_weather block for a location and 15-minute slot (epoch seconds)"""
+    rng = random.Random(zlib.crc32(f"{latitude:.2f},{longitude:.2f},{slot}".encode()))
+    local_hour = (slot / 3600 + longitude / 15) % 24
+    diurnal = 6 * math.sin(2 * math.pi * (local_hour - 9) / 24)
+    temperature = 28 - 0.45 * abs(latitude) + diurnal + rng.uniform(-1.5, 1.5)
+    return {
+        "time": datetime.fromtimestamp(slot, timezone.utc).strftime("%Y-%m-%dT%H:%M"),
+        "interval": UPDATE_INTERVAL,
+        "temperature": round(temperature, 1),
+        "windspeed": round(rng.uniform(0, 30), 1),
+        "winddirection": rng.randrange(360),
+        "is_day": int(6 <= local_hour < 18),
+        "weathercode": rng.choices(WEATHER_CODES, WEATHER_WEIGHTS)[0],
+    }
+
+
+def forecast(query, now):
+    latitudes = query.get("latitude", [""])[0].split(",")
+    longitudes = query.get("longitude", [""])[0].split(",")
+    try:
+        coordinates = [(float(lat), float(lon)) for lat, lon in zip(latitudes, longitudes, strict=True)]
+    except ValueError:
+        return 400, {"error": True, "reason": "Parameter 'latitude' and 'longitude' must have the same number of elements"}
+
+    slot = int(now) // UPDATE_INTERVAL * UPDATE_INTERVAL
+    results = [{
+        "latitude": round(lat, 2),
+        "longitude": round(lon, 2),
+        "generationtime_ms": 0.05,
+        "utc_offset_seconds": 0,
+        "timezone": "GMT",
+        "timezone_abbreviation": "GMT",
+        "elevation": 900.0,
+        "current_weather_units": {"time": "iso8601", "interval": "seconds", "temperature": "°C",
+                                  "windspeed": "km/h", "winddirection": "°", "is_day": "", "weathercode": "wmo code"},
+        "current_weather": synthetic_weather(lat, lon, slot),
+    } for lat, lon in coordinates]
+    return 200, results[0] if len(results) == 1 else results
+
+
+def reverse(query):
+    try:
+        lat = float(query["lat"][0])
+        lon = float(query["lon"][0])
+    except (KeyError, ValueError):
+        return 400, {"error": "Parameter 'lat' and 'lon' required"}
+
+    geocoder = get_offline_geocoder()
+    match = geocoder.nearest(lat, lon) if geocoder else None
+    if match is None or match[2] > MAX_PLACE_DISTANCE_KM:
+        return 200, {"error": "Unable to geocode"}
+    name, country, distance = match
+    place = "city" if distance < 15 else "town" if distance < 60 else "county"
+    return 200, {
+        "place_id": zlib.crc32(name.encode()),
+        "licence": "Synthetic data for local testing",
+        "osm_type": "node",
+        "lat": f"{lat:.7f}",
+        "lon": f"{lon:.7f}",
+        "display_name": f"{name}, {country}",
+        "address": {place: name, "country": country},
+    }
+
+
+class FaultInjector:
+    """Decides, per request, the delay and whether to fail or hang"""
+
+    def __init__(self, latency_ms=0, jitter_ms=0, error_rate=0.0, timeout_rate=0.0, hang_s=30, seed=None):
+        self.latency = latency_ms / 1000
+        self.jitter = jitter_ms / 1000
+        self.error_rate = error_rate
+        self.timeout_rate = timeout_rate
+        self.hang = hang_s
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.counts = {"requests": 0, "errors": 0, "timeouts": 0}
+
+    def next_fault(self):
+        """(delay seconds, "error" / "timeout" / None)"""
+        with self.lock:
+            self.counts["requests"] += 1
+            delay = self.latency + self.rng.uniform(0, self.jitter)
+            roll = self.rng.random()
+            if roll < self.timeout_rate:
+                self.counts["timeouts"] += 1
+                return self.hang, "timeout"
+            if roll < self.timeout_rate + self.error_rate:
+                self.counts["errors"] += 1
+                return delay, "error"
+            return delay, None
+
+
+class UpstreamHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def do_GET(self):
+        delay, fault = self.server.faults.next_fault()
+        if delay:
+            time.sleep(delay)
+        if fault == "timeout":
+            # Never answer; the client gives up on its own timeout
+            self.close_connection = True
+            return
+        if fault == "error":
+            status = self.server.faults.rng.choice(ERROR_STATUSES)
+            self.send_json(status, {"error": True, "reason": "Injected failure"})
+            return
+
+        url = urlsplit(self.path)
+        query = parse_qs(url.query)
+        if url.path.rstrip("/").endswith("/forecast"):
+            status, body = forecast(query, time.time())
+        elif url.path.rstrip("/").endswith("/reverse"):
+            status, body = reverse(query)
+        else:
+            status, body = 404, {"error": True, "reason": "Not found"}
+        self.send_json(status, body)
+
+    def send_json(self, status, body):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class UpstreamServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, address, faults, verbose=False):
+        super().__init__(address, UpstreamHandler)
+        self.faults = faults
+        self.verbose = verbose
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--latency", type=float, default=0, help="fixed delay per request, ms")
+    parser.add_argument("--jitter", type=float, default=0, help="extra random delay per request, up to this many ms")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered with an HTTP error")
+    parser.add_argument("--timeout-rate", type=float, default=0.0, help="share of requests that never get an answer")
+    parser.add_argument("--hang", type=float, default=30, help="seconds a 'timeout' request is held open")
+    parser.add_argument("--seed", type=int, help="seed for the injected faults")
+    parser.add_argument("--verbose", action="store_true", help="log every request")
+    args = parser.parse_args()
+
+    faults = FaultInjector(args.latency, args.jitter, args.error_rate, args.timeout_rate, args.hang, args.seed)
+    httpd = UpstreamServer((args.host, args.port), faults, args.verbose)
+    print(f"Fake Open-Meteo: http://{args.host}:{args.port}/v1/forecast")
+    print(f"Fake Nominatim:  http://{args.host}:{args.port}/reverse")
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+        print(f"Served {faults.counts['requests']} request(s): {faults.counts['errors']} injected error(s), "
+              f"{faults.counts['timeouts']} injected timeout(s)")
+
+
+if __name__ == "__main__":
+    main()
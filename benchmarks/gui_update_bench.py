@@ -0,0 +1,84 @@
+"""
+Micro-benchmark of WeatherDataDisplay.update_data.
+
+Measures updates per second of the viewer's detail panel in two modes:
+"rebuild" destroys and recreates every row on each update (the behaviour
+before rows were reused) and "diff" is the current in-place update.
+Needs a display (use xvfb-run on a headless machine).
+
+Run from the repository root:
+    python -m benchmarks.gui_update_bench --updates 2000 --extra-keys 20
+"""
+import argparse
+import time
+import tkinter as tk
+
+import server
+from reading import parse_reading
+
+
+def make_readings(count, extra_keys):
+    readings = []
+    for i in range(count):
+        reading = {
+            "station_id": "BENCH-000",
+            "station_name": "Benchmark Station",
+            "location": [12.9716, 77.5946],
+            "location_name": "Bengaluru",
+            "time": f"2025-04-19T10:{i % 60:02d}",
+            "temperature": f"{20 + i % 10}.0 °C",
+            "windspeed": f"{i % 25}.0 km/h",
+            "wind_direction": f"{i % 360}°",
+            "weather_code": (0, 1, 2, 3)[i % 4],
+        }
+        # Sensor fields that rarely change, as on a real station
+        for k in range(extra_keys):
+            reading[f"sensor_{k}"] = k if i % 50 else k + 1
+        readings.append(parse_reading(reading))
+    return readings
+
+
+def rebuild_update(viewer, data_dict):
+    for row in viewer.data_rows.values():
+        row[0].destroy()
+    viewer.data_rows.clear()
+    viewer.data_row_order = []
+    viewer.update_data(data_dict)
+
+
+def diff_update(viewer, data_dict):
+    viewer.update_data(data_dict)
+
+
+def measure(root, viewer, update, readings):
+    update(viewer, readings[0])
+    root.update()
+    start = time.perf_counter()
+    for reading in readings:
+        update(viewer, reading)
+        # Include the geometry and redraw work each update causes
+        root.update_idletasks()
+    return len(readings) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--updates", type=int, default=2000)
+    parser.add_argument("--extra-keys", type=int, default=20, help="additional fields per reading")
+    args = parser.parse_args()
+
+    try:
+        root = tk.Tk()
+    except tk.TclError as e:
+        raise SystemExit(f"No display available: {e}")
+    root.withdraw()
+    viewer = server.WeatherDataDisplay(root)
+    readings = make_readings(args.updates, args.extra_keys)
+
+    for name, update in (("rebuild", rebuild_update), ("diff", diff_update)):
+        print(f"{name:<10}{measure(root, viewer, update, readings):>12.1f} updates/s")
+    root.destroy()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""
+Compare the thread-per-connection server with the asyncio engine.
+
+Each engine is started in a child process on a free local port with an
+event hub that has no subscribers, then hammered by a pool of client threads
+that each open a TLS connection, send one reading and wait for the
+acknowledgment.
+
+Run from the repository root:
+    python -m benchmarks.ingest_bench --connections 2000 --clients 64
+"""
+import argparse
+import json
+import multiprocessing
+import socket
+import ssl
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import ingest
+
+SAMPLE_READING = {
+    "station_id": "BENCH-000",
+    "station_name": "Benchmark Station",
+    "location": [12.9716, 77.5946],
+    "location_name": "Bengaluru",
+    "time": "2025-04-19T10:00",
+    "temperature": "31.2 °C",
+    "windspeed": "12.0 km/h",
+    "wind_direction": "270°",
+    "weather_code": 1,
+}
+
+
+def run_engine(engine, port, backlog, max_concurrency):
+    events = ingest.IngestEvents()
+    if engine == "async":
+        ingest.start_async_server(events, "127.0.0.1", port, backlog, max_concurrency)
+    else:
+        ingest.start_server(events, "127.0.0.1", port, backlog)
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_for_port(port, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError(f"server did not start listening on port {port}")
+
+
+def client_context():
+    # The bundled certificate is self-signed; we measure throughput, not trust
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+    context.check_hostname = False
+    context.verify_mode = ssl.CERT_NONE
+    return context
+
+
+def send_one(port, context, payload):
+    start = time.perf_counter()
+    try:
+        with socket.create_connection(("127.0.0.1", port), timeout=30) as raw_sock:
+            with context.wrap_socket(raw_sock, server_hostname="localhost") as ssl_sock:
+                ssl_sock.sendall(payload)
+                if not ssl_sock.recv(1024):
+                    return None
+    except OSError:
+        return None
+    return time.perf_counter() - start
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return float("nan")
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def bench_engine(engine, args):
+    port = free_port()
+    proc = multiprocessing.Process(target=run_engine,
+                                   args=(engine, port, args.backlog, args.max_concurrency),
+                                   daemon=True)
+    proc.start()
+    try:
+        wait_for_port(port)
+        context = client_context()
+        payload = json.dumps(SAMPLE_READING).encode()
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.clients) as pool:
+            results = list(pool.map(lambda _: send_one(port, context, payload), range(args.connections)))
+        elapsed = time.perf_counter() - start
+    finally:
+        proc.terminate()
+        proc.join()
+
+    latencies = sorted(r for r in results if r is not None)
+    return {
+        "engine": engine,
+        "ok": len(latencies),
+        "failed": len(results) - len(latencies),
+        "conn_per_s": len(latencies) / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--connections", type=int, default=2000, help="total connections per engine")
+    parser.add_argument("--clients", type=int, default=64, help="concurrent client threads")
+    parser.add_argument("--backlog", type=int, default=ingest.BACKLOG)
+    parser.add_argument("--max-concurrency", type=int, default=ingest.MAX_CONCURRENT_CLIENTS)
+    parser.add_argument("--engines", default="threaded,async", help="comma-separated engines to run")
+    args = parser.parse_args()
+
+    print(f"{'engine':<10}{'ok':>8}{'failed':>8}{'conn/s':>10}{'p50 ms':>10}{'p99 ms':>10}")
+    for engine in args.engines.split(","):
+        r = bench_engine(engine.strip(), args)
+        print(f"{r['engine']:<10}{r['ok']:>8}{r['failed']:>8}{r['conn_per_s']:>10.1f}"
+              f"{r['p50_ms']:>10.2f}{r['p99_ms']:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,264 @@
+"""
+Load generator for the ingestion server.
+
+Starts the server (asyncio or threaded engine) in a child process with the
+bundled server.crt/server.key, then simulates many stations with asyncio
+clients, optionally spread over several processes. Each station sends
+--readings framed readings, one per --period seconds, and waits for each
+acknowledgment before sending the next.
+
+  --reuse persistent   one TLS connection per station, kept open
+  --reuse none         a new TLS connection for every reading
+  --pattern steady     stations spread evenly over each period
+  --pattern burst      every station sends at the start of each period
+                       (the top-of-minute rush of cron-driven clients)
+  --period 0           no pacing: send as fast as acknowledgments come back
+
+Reports accepted readings/s, TLS connect+handshake time and p50/p95/p99 ack
+latency. With --output, the results and parameters are appended as one JSON
+line per run, so runs can be compared over time.
+
+Run from the repository root:
+    python -m benchmarks.load_bench --stations 2000 --readings 3 --period 10 --pattern burst
+    python -m benchmarks.load_bench --stations 200 --period 0 --reuse none --output load_results.jsonl
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import resource
+import ssl
+import subprocess
+import time
+
+import ingest
+from benchmarks.ingest_bench import client_context, free_port, percentile, run_engine, wait_for_port
+from protocol import (SEQ_KEY, BinaryEncoder, encode_frame, make_hello, parse_ack, parse_hello_reply,
+                      read_frame_async)
+from reading import parse_reading
+
+# Seconds a single connect, send or acknowledgment may take before it counts as failed
+OP_TIMEOUT = 30
+
+
+def raise_fd_limit():
+    """Thousands of open connections need more than the default 1024 descriptors"""
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+
+def run_server(engine, port, backlog, max_concurrency):
+    raise_fd_limit()
+    run_engine(engine, port, backlog, max_concurrency)
+
+
+def make_reading(station, index, payload_bytes):
+    reading = {
+        "station_id": f"LOAD-{station:05d}",
+        "station_name": f"Load Station {station}",
+        "location": [12.9716 + station % 100 * 0.01, 77.5946 + station // 100 * 0.01],
+        "location_name": "Load Test",
+        "time": 1745000000 + index * 60,
+        "temperature": f"{20 + (station + index) % 15}.5 °C",
+        "windspeed": f"{(station * 7 + index) % 40}.0 km/h",
+        "wind_direction": f"{(station * 13) % 360}°",
+        "weather_code": index % 4,
+    }
+    size = len(json.dumps(reading))
+    if payload_bytes > size:
+        reading["padding"] = "x" * (payload_bytes - size - 14)
+    return reading
+
+
+def send_time(start, station, index, args):
+    """Wall-clock time at which a station sends its index-th reading"""
+    if args.period <= 0:
+        return start
+    offset = 0.0 if args.pattern == "burst" else station / args.stations * args.period
+    return start + index * args.period + offset
+
+
+class StationClient:
+    """One simulated station: a connection (kept or not) and the timings it saw"""
+
+    def __init__(self, station, port, context, args, results):
+        self.station = station
+        self.port = port
+        self.context = context
+        self.args = args
+        self.results = results
+        self.reader = None
+        self.writer = None
+        self.encoder = None
+
+    async def connect(self):
+        started = time.perf_counter()
+        self.reader, self.writer = await asyncio.wait_for(
+            asyncio.open_connection("127.0.0.1", self.port, ssl=self.context, server_hostname="localhost"),
+            OP_TIMEOUT)
+        self.results["handshakes"].append(time.perf_counter() - started)
+        self.encoder = None
+        if self.args.encoding == "binary":
+            self.writer.write(encode_frame(make_hello()))
+            reply = await asyncio.wait_for(read_frame_async(self.reader), OP_TIMEOUT)
+            if reply is not None and parse_hello_reply(reply) == "binary":
+                self.encoder = BinaryEncoder()
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            try:
+                await self.writer.wait_closed()
+            except (OSError, ssl.SSLError):
+                pass
+        self.reader = self.writer = None
+
+    async def send(self, seq, reading):
+        if self.writer is None:
+            await self.connect()
+        if self.encoder is not None:
+            frame = encode_frame(self.encoder.encode(seq, [parse_reading(reading)]))
+        else:
+            frame = encode_frame(json.dumps(dict(reading, **{SEQ_KEY: seq})))
+        started = time.perf_counter()
+        self.writer.write(frame)
+        await self.writer.drain()
+        payload = await asyncio.wait_for(read_frame_async(self.reader), OP_TIMEOUT)
+        if payload is None or parse_ack(payload) != seq:
+            raise ConnectionError("missing or unexpected acknowledgment")
+        self.results["latencies"].append(time.perf_counter() - started)
+        self.results["bytes"] += len(frame)
+
+    async def run(self, start):
+        for index in range(self.args.readings):
+            delay = send_time(start, self.station, index, self.args) - time.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            try:
+                await self.send(index + 1, make_reading(self.station, index, self.args.payload_bytes))
+                self.results["last_ack"] = max(self.results["last_ack"], time.time())
+            except (OSError, ssl.SSLError, asyncio.TimeoutError, ConnectionError) as e:
+                self.results["failed"] += 1
+                errors = self.results["errors"]
+                errors[type(e).__name__] = errors.get(type(e).__name__, 0) + 1
+                await self.close()
+                continue
+            if self.args.reuse == "none":
+                await self.close()
+        await self.close()
+
+
+async def run_stations(stations, port, args, start):
+    context = client_context()
+    results = {"latencies": [], "handshakes": [], "failed": 0, "errors": {}, "bytes": 0, "last_ack": 0.0}
+    clients = [StationClient(station, port, context, args, results) for station in stations]
+    await asyncio.gather(*(client.run(start) for client in clients))
+    return results
+
+
+def run_slice(task):
+    """Process entry point: run a share of the stations and return their timings"""
+    stations, port, args, start = task
+    raise_fd_limit()
+    return asyncio.run(run_stations(stations, port, args, start))
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def milliseconds(sorted_values, pct):
+    return round(percentile(sorted_values, pct) * 1000, 3) if sorted_values else None
+
+
+def summarize(parts, start):
+    latencies = sorted(latency for part in parts for latency in part["latencies"])
+    handshakes = sorted(handshake for part in parts for handshake in part["handshakes"])
+    errors = {}
+    for part in parts:
+        for name, count in part["errors"].items():
+            errors[name] = errors.get(name, 0) + count
+    last_ack = max(part["last_ack"] for part in parts)
+    elapsed = max(last_ack - start, 1e-9)
+    return {
+        "accepted": len(latencies),
+        "failed": sum(part["failed"] for part in parts),
+        "errors": errors,
+        "elapsed_s": round(elapsed, 3) if latencies else None,
+        "readings_per_s": round(len(latencies) / elapsed, 1) if latencies else 0.0,
+        "bytes_per_reading": round(sum(part["bytes"] for part in parts) / len(latencies), 1) if latencies else None,
+        "handshakes": len(handshakes),
+        "handshake_p50_ms": milliseconds(handshakes, 50),
+        "handshake_p95_ms": milliseconds(handshakes, 95),
+        "handshake_p99_ms": milliseconds(handshakes, 99),
+        "ack_p50_ms": milliseconds(latencies, 50),
+        "ack_p95_ms": milliseconds(latencies, 95),
+        "ack_p99_ms": milliseconds(latencies, 99),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--stations", type=int, default=1000, help="simulated stations")
+    parser.add_argument("--readings", type=int, default=3, help="readings sent by each station")
+    parser.add_argument("--period", type=float, default=10.0, help="seconds between a station's readings")
+    parser.add_argument("--pattern", choices=("steady", "burst"), default="steady")
+    parser.add_argument("--reuse", choices=("persistent", "none"), default="persistent")
+    parser.add_argument("--encoding", choices=("json", "binary"), default="json")
+    parser.add_argument("--payload-bytes", type=int, default=0, help="pad JSON readings to about this size")
+    parser.add_argument("--processes", type=int, default=1, help="load generator processes")
+    parser.add_argument("--engine", choices=("async", "threaded"), default="async")
+    parser.add_argument("--backlog", type=int, default=ingest.BACKLOG)
+    parser.add_argument("--max-concurrency", type=int, default=ingest.MAX_CONCURRENT_CLIENTS)
+    parser.add_argument("--output", help="append the results as a JSON line to this file")
+    args = parser.parse_args()
+
+    raise_fd_limit()
+    port = free_port()
+    proc = multiprocessing.Process(target=run_server,
+                                   args=(args.engine, port, args.backlog, args.max_concurrency),
+                                   daemon=True)
+    proc.start()
+    try:
+        wait_for_port(port)
+        start = time.time() + 1.0  # lets every generator process get going before the first send
+        slices = [(list(range(i, args.stations, args.processes)), port, args, start)
+                  for i in range(args.processes)]
+        if args.processes == 1:
+            parts = [run_slice(slices[0])]
+        else:
+            with multiprocessing.Pool(args.processes) as pool:
+                parts = pool.map(run_slice, slices)
+    finally:
+        proc.terminate()
+        proc.join()
+
+    results = summarize(parts, start)
+    print(f"{args.stations} stations x {args.readings} readings, {args.pattern} every {args.period}s, "
+          f"{args.reuse} connections, {args.encoding}, {args.engine} engine")
+    print(f"accepted {results['accepted']}  failed {results['failed']} {results['errors'] or ''}  "
+          f"{results['readings_per_s']} readings/s over {results['elapsed_s']}s  "
+          f"{results['bytes_per_reading']} B/reading")
+    print(f"handshake ms ({results['handshakes']}): p50 {results['handshake_p50_ms']}  "
+          f"p95 {results['handshake_p95_ms']}  p99 {results['handshake_p99_ms']}")
+    print(f"ack ms: p50 {results['ack_p50_ms']}  p95 {results['ack_p95_ms']}  p99 {results['ack_p99_ms']}")
+
+    if args.output:
+        record = {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "revision": git_revision(),
+            "params": {key: value for key, value in vars(args).items() if key != "output"},
+            "results": results,
+        }
+        with open(args.output, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record) + "\n")
+        print(f"Results appended to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
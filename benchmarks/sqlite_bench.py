@@ -0,0 +1,66 @@
+"""
+Sustained insert rate of the SQLite store.
+
+Measures readings/s through the batched writer thread (the path the server
+uses), through bulk_load, and the latency of a one-hour range query for one
+station once the table is populated.
+
+Run from the repository root:
+    python -m benchmarks.sqlite_bench --readings 200000 --stations 1000
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from reading import parse_reading
+from sqlite_store import SqliteStore
+
+
+def make_readings(count, stations, start_time=1745000000):
+    for i in range(count):
+        yield parse_reading({
+            "station_id": f"WS-{i % stations:05d}",
+            "station_name": "Benchmark Station",
+            "location": [12.9716, 77.5946],
+            "location_name": "Bengaluru",
+            "time": start_time + (i // stations) * 60,
+            "temperature": f"{20 + i % 15}.0 °C",
+            "windspeed": f"{i % 30}.0 km/h",
+            "wind_direction": f"{i % 360}°",
+            "weather_code": i % 4,
+        })
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--readings", type=int, default=200000)
+    parser.add_argument("--stations", type=int, default=1000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+
+        store = SqliteStore(path)
+        start = time.perf_counter()
+        for reading in make_readings(args.readings, args.stations):
+            store.add(reading)
+        store.close()
+        elapsed = time.perf_counter() - start
+        print(f"batched writer  {args.readings / elapsed:>12.0f} inserts/s "
+              f"({store.batches_written} transactions)")
+
+        start = time.perf_counter()
+        loaded = store.bulk_load(make_readings(args.readings, args.stations, start_time=1746000000))
+        elapsed = time.perf_counter() - start
+        print(f"bulk load       {loaded / elapsed:>12.0f} inserts/s")
+
+        total = store.count()
+        start = time.perf_counter()
+        rows = store.query("WS-00000", 1745000000, 1745000000 + 3600)
+        elapsed = time.perf_counter() - start
+        print(f"range query     {elapsed * 1000:>12.2f} ms for {len(rows)} rows out of {total}")
+
+
+if __name__ == "__main__":
+    main()
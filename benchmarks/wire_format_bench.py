@@ -0,0 +1,92 @@
+"""
+Bytes per reading and server parse time per reading, JSON vs binary.
+
+Encodes the same readings as the station clients would (one reading per
+frame, and batches) in both encodings, then times what the server does with
+each payload before storing it: json.loads plus parse_reading for JSON,
+BinaryDecoder.decode for binary. The binary station dictionary is primed
+first, as it is on a long-lived connection.
+
+Run from the repository root:
+    python -m benchmarks.wire_format_bench --readings 100000 --stations 100
+"""
+import argparse
+import json
+import time
+
+from protocol import HEADER, SEQ_KEY, BinaryDecoder, BinaryEncoder, unpack_document
+from reading import parse_reading
+
+
+def make_documents(count, stations, start_time=1745000000):
+    return [{
+        "station_id": f"WS-{i % stations:03d}",
+        "station_name": f"Benchmark Station {i % stations}",
+        "location": [12.9716 + (i % stations) * 0.01, 77.5946],
+        "time": f"2025-04-19T{(i // stations) // 60 % 24:02d}:{(i // stations) % 60:02d}",
+        "temperature": f"{20 + i % 15}.{i % 10} °C",
+        "windspeed": f"{i % 30}.{i % 7} km/h",
+        "wind_direction": f"{i % 360}°",
+        "weather_code": i % 4,
+    } for i in range(count)]
+
+
+def json_payloads(documents, batch):
+    if batch == 1:
+        return [json.dumps(dict(doc, **{SEQ_KEY: seq})).encode()
+                for seq, doc in enumerate(documents, 1)]
+    return [json.dumps({SEQ_KEY: seq, "readings": documents[start:start + batch]}).encode()
+            for seq, start in enumerate(range(0, len(documents), batch), 1)]
+
+
+def binary_payloads(documents, batch):
+    encoder = BinaryEncoder()
+    readings = [parse_reading(doc) for doc in documents]
+    return [encoder.encode(seq, readings[start:start + batch])
+            for seq, start in enumerate(range(0, len(readings), batch), 1)]
+
+
+def parse_json(payloads):
+    for payload in payloads:
+        _, items, _ = unpack_document(json.loads(payload))
+        for item in items:
+            parse_reading(item)
+
+
+def parse_binary(payloads):
+    decoder = BinaryDecoder()
+    decoder.decode(payloads[0])  # prime the station dictionary
+    for payload in payloads:
+        decoder.decode(payload)
+
+
+def measure(name, payloads, parse, count, repeat):
+    size = sum(len(p) + HEADER.size for p in payloads)
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        parse(payloads)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    print(f"{name:<22}{size / count:>12.1f}{best / count * 1e6:>14.2f}{count / best:>14.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--readings", type=int, default=100000)
+    parser.add_argument("--stations", type=int, default=100)
+    parser.add_argument("--batch", type=int, default=500, help="readings per batch frame")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    documents = make_documents(args.readings, args.stations)
+    print(f"{args.readings} readings from {args.stations} stations (best of {args.repeat})")
+    print(f"{'encoding':<22}{'bytes/reading':>12}{'parse us/rd':>14}{'readings/s':>14}")
+    for batch in (1, args.batch):
+        label = "single" if batch == 1 else f"batch {batch}"
+        measure(f"json, {label}", json_payloads(documents, batch), parse_json, args.readings, args.repeat)
+        measure(f"binary, {label}", binary_payloads(documents, batch), parse_binary, args.readings, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
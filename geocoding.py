@@ -0,0 +1,405 @@
+"""
+Reverse geocoding for station coordinates.
+
+Lookups go through two cache levels before touching Nominatim: an in-memory
+LRU and a JSON file on disk that survives restarts. Both are keyed by the
+coordinates rounded to COORD_PRECISION decimals (roughly 100 m), since
+stations do not move. Entries expire after CACHE_TTL; failed lookups are
+remembered in memory only, for FAILURE_TTL, so an outage is retried later
+without hammering the API meanwhile.
+
+Names can also be resolved without any network access from a bundled
+gazetteer (gazetteer.csv: name, lat, lon, country) held in a k-d tree.
+GEOCODER_MODE selects the strategy:
+    "online"  - cache, then Nominatim
+    "offline" - cache, then the nearest gazetteer place, never the network
+    "hybrid"  - the nearest gazetteer place if it is within
+                OFFLINE_MAX_DISTANCE_KM, otherwise Nominatim
+
+Nominatim is never called more than NOMINATIM_RATE_LIMIT times per second.
+NOMINATIM_URL, NOMINATIM_RATE_LIMIT and GEOCODER_MODE can be overridden by
+environment variables of the same name, e.g. to point the server at the fake
+upstream in benchmarks/fake_upstream.py.
+The server resolves names through location_worker, which answers from the
+cache or gazetteer immediately and otherwise looks the name up on a
+background thread, so ingestion never waits on the network.
+"""
+import csv
+import json
+import math
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+
+
+import metrics
+
+NOMINATIM_URL = os.environ.get("NOMINATIM_URL", "https://nominatim.openstreetmap.org/reverse")
+USER_AGENT = "WeatherMonitoringServer/1.0"
+
+# Nominatim usage policy: at most one request per second
+NOMINATIM_RATE_LIMIT = float(os.environ.get("NOMINATIM_RATE_LIMIT", 1.0))
+
+# Background threads resolving names for the ingestion path
+GEOCODE_WORKERS = 2
+UNKNOWN_LOCATION = "Unknown Location"
+
+# Cache configuration
+CACHE_FILE = "geocode_cache.json"
+COORD_PRECISION = 3
+MEMORY_CACHE_SIZE = 4096
+CACHE_TTL = 30 * 24 * 3600
+FAILURE_TTL = 10 * 60
+
+# Offline geocoder configuration
+GEOCODER_MODE = os.environ.get("GEOCODER_MODE", "hybrid")
+GAZETTEER_FILE = "gazetteer.csv"
+OFFLINE_MAX_DISTANCE_KM = 30
+
+EARTH_RADIUS_KM = 6371.0
+
+
+class GeocodeCache:
+    """Two-level (memory LRU + JSON file) cache of location names by coordinates"""
+
+    def __init__(self, path=CACHE_FILE, capacity=MEMORY_CACHE_SIZE, ttl=CACHE_TTL,
+                 precision=COORD_PRECISION):
+        self.path = path
+        self.capacity = capacity
+        self.ttl = ttl
+        self.precision = precision
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()  # key -> (name, expires_at), least recently used first
+        self._disk = self._load()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def key(self, lat, lon):
+        return f"{round(float(lat), self.precision)},{round(float(lon), self.precision)}"
+
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                entries = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        now = time.time()
+        return {key: (name, expires) for key, (name, expires) in entries.items() if expires > now}
+
+    def _save(self):
+        # Written to a temporary file first so a crash never leaves a torn cache
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._disk, f)
+        os.replace(tmp_path, self.path)
+
+    def _remember(self, key, entry):
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        if len(self._memory) > self.capacity:
+            self._memory.popitem(last=False)
+
+    def get(self, lat, lon):
+        """Return the cached name for the coordinates, or None"""
+        key = self.key(lat, lon)
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and entry[1] > now:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return entry[0]
+            entry = self._disk.get(key)
+            if entry is not None and entry[1] > now:
+                self._remember(key, entry)
+                self.disk_hits += 1
+                return entry[0]
+            self.misses += 1
+            return None
+
+    def put(self, lat, lon, name, ttl=None, persist=True):
+        """Cache a name; persist=False keeps it out of the file (used for failures)"""
+        key = self.key(lat, lon)
+        entry = (name, time.time() + (self.ttl if ttl is None else ttl))
+        with self._lock:
+            self._remember(key, entry)
+            if persist and self.path:
+                self._disk[key] = entry
+                try:
+                    self._save()
+                except OSError:
+                    pass
+
+    def stats(self):
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_ratio": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+                "memory_entries": len(self._memory),
+                "disk_entries": len(self._disk),
+            }
+
+
+# Shared cache used by get_location_name
+location_cache = GeocodeCache()
+
+
+def _to_unit_vector(lat, lon):
+    """Points on the unit sphere; straight-line distance there grows with great-circle distance"""
+    lat_r = math.radians(float(lat))
+    lon_r = math.radians(float(lon))
+    cos_lat = math.cos(lat_r)
+    return (cos_lat * math.cos(lon_r), cos_lat * math.sin(lon_r), math.sin(lat_r))
+
+
+class OfflineGeocoder:
+    """Nearest-place lookups over a gazetteer, using a k-d tree of unit vectors"""
+
+    def __init__(self, places):
+        # places: iterable of (name, lat, lon, country)
+        points = [(_to_unit_vector(lat, lon), (name, country)) for name, lat, lon, country in places]
+        self.size = len(points)
+        self._root = self._build(points, 0)
+
+    @classmethod
+    def from_csv(cls, path=GAZETTEER_FILE):
+        with open(path, "r", encoding="utf-8", newline="") as f:
+            rows = [(row["name"], float(row["lat"]), float(row["lon"]), row.get("country", ""))
+                    for row in csv.DictReader(f)]
+        return cls(rows)
+
+    def _build(self, points, axis):
+        # Node layout: (point, place, axis, left, right)
+        if not points:
+            return None
+        points.sort(key=lambda p: p[0][axis])
+        middle = len(points) // 2
+        next_axis = (axis + 1) % 3
+        return (points[middle][0], points[middle][1], axis,
+                self._build(points[:middle], next_axis),
+                self._build(points[middle + 1:], next_axis))
+
+    def nearest(self, lat, lon):
+        """Return (name, country, distance_km) of the closest place, or None if the gazetteer is empty"""
+        if self._root is None:
+            return None
+        target = _to_unit_vector(lat, lon)
+        best = [None, float("inf")]  # place, squared chord distance
+        stack = [self._root]
+        while stack:
+            node = stack.pop()
+            if node is None:
+                continue
+            point, place, axis, left, right = node
+            dx = point[0] - target[0]
+            dy = point[1] - target[1]
+            dz = point[2] - target[2]
+            dist = dx * dx + dy * dy + dz * dz
+            if dist < best[1]:
+                best[0], best[1] = place, dist
+            diff = target[axis] - point[axis]
+            near, far = (left, right) if diff < 0 else (right, left)
+            # The far side can only hold a closer point if the splitting plane is closer
+            if diff * diff < best[1]:
+                stack.append(far)
+            stack.append(near)
+        chord = math.sqrt(best[1])
+        distance_km = 2 * EARTH_RADIUS_KM * math.asin(min(1.0, chord / 2))
+        return best[0][0], best[0][1], distance_km
+
+
+_offline_geocoder = None
+_offline_lock = threading.Lock()
+
+
+def get_offline_geocoder():
+    """Load the bundled gazetteer on first use; None if it is missing"""
+    global _offline_geocoder
+    if _offline_geocoder is None:
+        with _offline_lock:
+            if _offline_geocoder is None:
+                try:
+                    _offline_geocoder = OfflineGeocoder.from_csv(GAZETTEER_FILE)
+                except (OSError, KeyError, ValueError):
+                    _offline_geocoder = OfflineGeocoder([])
+    return _offline_geocoder if _offline_geocoder.size else None
+
+
+class RateLimiter:
+    """Spaces calls at least 1/rate seconds apart across all threads"""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0.0
+        self._next_slot = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+_nominatim_limiter = RateLimiter(NOMINATIM_RATE_LIMIT)
+
+NOMINATIM_SECONDS = metrics.histogram("weather_server_nominatim_request_seconds",
+                                      "Nominatim reverse lookups, after rate limiting")
+NOMINATIM_FAILURES = metrics.counter("weather_server_nominatim_failures_total", "Failed Nominatim lookups")
+
+
+def lookup_nominatim(lat, lon):
+    """Ask Nominatim for a location name; returns None if the lookup failed"""
+    try:
+        _nominatim_limiter.wait()
+        headers = {
+            "User-Agent": USER_AGENT
+        }
+        # Imported here so the server starts without paying for requests
+        # until a name actually has to come from the network
+        import requests
+        started = time.perf_counter()
+        try:
+            response = requests.get(NOMINATIM_URL, params={"lat": lat, "lon": lon, "format": "json"},
+                                    headers=headers, timeout=5)
+        finally:
+            NOMINATIM_SECONDS.observe(time.perf_counter() - started)
+        if response.status_code != 200:
+            NOMINATIM_FAILURES.inc()
+            return None
+        data = response.json()
+        if "address" not in data:
+            return UNKNOWN_LOCATION
+        address = data["address"]
+        # Try to construct a sensible location name
+        if "city" in address:
+            return address["city"]
+        elif "town" in address:
+            return address["town"]
+        elif "village" in address:
+            return address["village"]
+        elif "suburb" in address:
+            return address["suburb"]
+        elif "county" in address:
+            return address["county"]
+        else:
+            return f"{address.get('state', '')}, {address.get('country', '')}"
+    except Exception:
+        NOMINATIM_FAILURES.inc()
+        return None
+
+
+def resolve_locally(lat, lon):
+    """Name from the cache or the gazetteer (per GEOCODER_MODE), or None if the network is needed"""
+    name = location_cache.get(lat, lon)
+    if name is not None:
+        return name
+
+    if GEOCODER_MODE in ("offline", "hybrid"):
+        geocoder = get_offline_geocoder()
+        match = geocoder.nearest(lat, lon) if geocoder else None
+        if match and (GEOCODER_MODE == "offline" or match[2] <= OFFLINE_MAX_DISTANCE_KM):
+            location_cache.put(lat, lon, match[0], persist=False)
+            return match[0]
+        if GEOCODER_MODE == "offline":
+            return UNKNOWN_LOCATION
+    return None
+
+
+def resolve_remotely(lat, lon):
+    """Name from Nominatim, cached either way"""
+    name = lookup_nominatim(lat, lon)
+    if name is None:
+        location_cache.put(lat, lon, UNKNOWN_LOCATION, ttl=FAILURE_TTL, persist=False)
+        return UNKNOWN_LOCATION
+    location_cache.put(lat, lon, name)
+    return name
+
+
+def get_location_name(lat, lon):
+    """Get location name from coordinates, using the cache before Nominatim"""
+    try:
+        name = resolve_locally(lat, lon)
+    except (TypeError, ValueError):
+        return UNKNOWN_LOCATION
+    if name is not None:
+        return name
+    return resolve_remotely(lat, lon)
+
+
+class GeocodeWorker:
+    """
+    Resolves names that are not available locally on background threads.
+    Concurrent requests for the same (rounded) coordinates are coalesced
+    into a single lookup whose result is passed to every waiting callback.
+    """
+
+    def __init__(self, workers=GEOCODE_WORKERS):
+        self.workers = workers
+        self._queue = queue.Queue()
+        self._waiters = {}  # cache key -> callbacks waiting for that lookup
+        self._lock = threading.Lock()
+        self._threads = []
+        self.lookups = 0
+        self.coalesced = 0
+
+    def lookup(self, lat, lon, callback):
+        """
+        Return the name right away if it can be resolved locally. Otherwise
+        schedule a background lookup, return None, and call callback(name)
+        from a worker thread once the name is known.
+        """
+        try:
+            name = resolve_locally(lat, lon)
+            key = location_cache.key(lat, lon)
+        except (TypeError, ValueError):
+            return UNKNOWN_LOCATION
+        if name is not None:
+            return name
+
+        with self._lock:
+            waiters = self._waiters.get(key)
+            if waiters is not None:
+                waiters.append(callback)
+                self.coalesced += 1
+                return None
+            self._waiters[key] = [callback]
+            self.lookups += 1
+            self._start_threads()
+        self._queue.put((lat, lon, key))
+        return None
+
+    def pending(self):
+        with self._lock:
+            return len(self._waiters)
+
+    def _start_threads(self):
+        while len(self._threads) < self.workers:
+            thread = threading.Thread(target=self._run, name="geocoder", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _run(self):
+        while True:
+            lat, lon, key = self._queue.get()
+            name = resolve_remotely(lat, lon)
+            with self._lock:
+                callbacks = self._waiters.pop(key, [])
+            for callback in callbacks:
+                try:
+                    callback(name)
+                except Exception:
+                    pass
+
+
+# Shared background resolver used by the server's ingestion path
+location_worker = GeocodeWorker()
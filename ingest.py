@@ -0,0 +1,742 @@
+"""
+Ingestion core of the weather monitoring server, without any GUI.
+
+Everything that accepts, parses, stores and serves readings lives here: the
+TLS engines (asyncio and thread-per-connection), the shared station state,
+the ingest log, the SQLite store and the query API. Nothing in this module
+imports tkinter, so a production node can run it on a machine without a
+display:
+
+    python ingest.py --log-level info
+
+The core reports what it does through an IngestEvents hub. Observers
+subscribe to it and receive log(message, tag), update_status(message) and
+connections_changed(count) calls on ingestion threads; with no subscribers
+an event costs one empty loop. ConsoleSubscriber prints events to stdout;
+server.py attaches the Tk GUI the same way.
+"""
+import argparse
+import asyncio
+import json
+import socket
+import ssl
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+from geocoding import location_worker
+from ingest_log import IngestLog
+from reading import DELTA_KEY, apply_delta, parse_reading, reading_from_dict
+from query_api import QUERY_API_HOST, QUERY_API_PORT, QueryService, make_query_server
+from sqlite_store import SqliteStore
+from timeseries import HistoryStore
+from protocol import (ACK_ERROR, HEADER, HELLO_KEY, BinaryDecoder, FrameError, answer_hello, encode_frame,
+                      is_binary, is_legacy_header, make_ack, read_frame, read_frame_async, recv_exact,
+                      unpack_document)
+
+# Server Configuration
+HOST = '0.0.0.0'
+PORT = 9000
+CERT_FILE = 'server.crt'
+KEY_FILE = 'server.key'
+
+# Pending connections the kernel may queue while we are busy accepting
+BACKLOG = 1024
+
+# Upper bound on open connections served at once by the asyncio engine
+MAX_CONCURRENT_CLIENTS = 10000
+
+# Threads used by the asyncio engine for blocking work (JSON handling, geocoding)
+WORKER_THREADS = 32
+
+# Seconds a client may take to complete the TLS handshake
+SSL_HANDSHAKE_TIMEOUT = 10
+
+# TLS 1.3 session tickets issued per handshake so clients can resume instead of
+# paying for a full handshake on reconnect
+SESSION_TICKETS = 2
+
+# Seconds a persistent connection may stay silent before the server closes it.
+# Clients poll just after each upstream refresh, up to UPSTREAM_INTERVAL +
+# UPSTREAM_MARGIN (960 s, see weather_api.py) apart, so this must be longer
+# or every poll would find its connection closed and handshake again.
+CLIENT_IDLE_TIMEOUT = 1200
+
+# Durable log of accepted readings, replayed into memory at startup
+ENABLE_INGEST_LOG = True
+
+# Seconds an acknowledgment may wait for its readings to reach the ingest log
+# on disk; past that the connection is dropped so the client resends them
+ACK_SYNC_TIMEOUT = 5
+
+# Optional SQLite copy of every reading for long-term queries
+ENABLE_SQLITE_STORE = False
+
+# Local HTTP/JSON query endpoint next to the TLS ingestion port
+ENABLE_QUERY_API = True
+
+# Record counters and stage timings (served at /metrics); off skips the per-reading timers too
+ENABLE_METRICS = True
+
+# Severity of each log tag, and the choices offered by the level filters
+LOG_LEVELS = {"DATA": 10, "CONNECT": 20, "INFO": 20, "ERROR": 40}
+LOG_FILTERS = {"All": 0, "Info": 20, "Errors": 40}
+
+# Global dictionary to store data from all weather stations
+stations_data = {}
+
+# Bounded numeric history of every station's readings
+station_history = HistoryStore()
+
+# Append-only log of accepted readings (opened by open_ingest_log)
+ingest_log = None
+
+# SQLite store of all readings (created when ENABLE_SQLITE_STORE is set)
+sqlite_store = None
+
+# Stations updated since a display last redrew: ingestion threads add to it,
+# the GUI's data viewer takes the whole set on each refresh tick
+_changed_stations = set()
+_changed_lock = threading.Lock()
+
+# Change counter of every station, used for the query API's ETags
+station_versions = {}
+_version_counter = 0
+
+# Metrics, served at /metrics on the query API
+_STAGE_HELP = "Time spent in each stage of handling client data"
+STAGE_HANDSHAKE = metrics.histogram("weather_server_stage_seconds", _STAGE_HELP, stage="handshake")
+STAGE_DECODE = metrics.histogram("weather_server_stage_seconds", _STAGE_HELP, stage="decode")
+STAGE_PARSE = metrics.histogram("weather_server_stage_seconds", _STAGE_HELP, stage="parse")
+STAGE_GEOCODE = metrics.histogram("weather_server_stage_seconds", _STAGE_HELP, stage="geocode")
+STAGE_STORE = metrics.histogram("weather_server_stage_seconds", _STAGE_HELP, stage="store")
+STAGE_PERSIST = metrics.histogram("weather_server_stage_seconds", _STAGE_HELP, stage="persist")
+STAGE_SYNC = metrics.histogram("weather_server_stage_seconds", _STAGE_HELP, stage="sync")
+STAGE_LOG = metrics.histogram("weather_server_stage_seconds", _STAGE_HELP, stage="gui_log")
+STAGE_ACK = metrics.histogram("weather_server_stage_seconds", _STAGE_HELP, stage="ack")
+STAGE_FRAME = metrics.histogram("weather_server_stage_seconds", _STAGE_HELP, stage="frame")
+FRAMES = {encoding: metrics.counter("weather_server_frames_total", "Frames received, by encoding",
+                                    encoding=encoding) for encoding in ("json", "binary", "legacy")}
+BYTES_RECEIVED = metrics.counter("weather_server_received_bytes_total", "Payload bytes received from clients")
+READINGS_STORED = metrics.counter("weather_server_readings_total", "Readings stored")
+READINGS_REJECTED = metrics.counter("weather_server_rejected_readings_total", "Readings rejected as invalid")
+PROTOCOL_ERRORS = metrics.counter("weather_server_protocol_errors_total", "Connections dropped for protocol errors")
+HANDSHAKES = {kind: metrics.counter("weather_server_tls_handshakes_total", "TLS handshakes, by outcome",
+                                    kind=kind) for kind in ("full", "resumed", "failed")}
+
+def mark_station_changed(station_id):
+    global _version_counter
+    with _changed_lock:
+        _changed_stations.add(station_id)
+        _version_counter += 1
+        station_versions[station_id] = _version_counter
+
+def take_changed_stations():
+    global _changed_stations
+    with _changed_lock:
+        changed, _changed_stations = _changed_stations, set()
+    return changed
+
+# Event interface between the ingestion core and its observers
+class IngestSubscriber:
+    """
+    Base class for observers of an IngestEvents hub. Methods are called on
+    ingestion threads, so they must be quick and thread-safe; subclasses
+    override the ones they care about.
+    """
+
+    def log(self, message, tag="INFO"):
+        pass
+
+    def update_status(self, message):
+        pass
+
+    def connections_changed(self, count):
+        pass
+
+class IngestEvents:
+    """Fans the core's events out to its subscribers and counts connected clients"""
+
+    def __init__(self):
+        # Replaced, never mutated, so emitters can iterate without taking the lock
+        self._subscribers = ()
+        self._lock = threading.Lock()
+        self.clients_connected = 0
+
+    def subscribe(self, subscriber):
+        with self._lock:
+            self._subscribers += (subscriber,)
+        subscriber.connections_changed(self.clients_connected)
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers = tuple(s for s in self._subscribers if s is not subscriber)
+
+    def log(self, message, tag="INFO"):
+        for subscriber in self._subscribers:
+            subscriber.log(message, tag)
+
+    def update_status(self, message):
+        for subscriber in self._subscribers:
+            subscriber.update_status(message)
+
+    def client_connected(self):
+        with self._lock:
+            self.clients_connected += 1
+            count = self.clients_connected
+        self._connections_changed(count)
+
+    def client_disconnected(self):
+        with self._lock:
+            self.clients_connected = max(0, self.clients_connected - 1)
+            count = self.clients_connected
+        self._connections_changed(count)
+
+    def _connections_changed(self, count):
+        for subscriber in self._subscribers:
+            subscriber.connections_changed(count)
+            subscriber.update_status(f"{count} client(s) connected")
+
+class ConsoleSubscriber(IngestSubscriber):
+    """Writes log events at or above min_level to a stream, one timestamped line each"""
+
+    def __init__(self, min_level=LOG_FILTERS["Info"], stream=None):
+        self.min_level = min_level
+        self.stream = stream or sys.stdout
+
+    def log(self, message, tag="INFO"):
+        if LOG_LEVELS.get(tag, 20) >= self.min_level:
+            self.stream.write(f"{time.strftime('%H:%M:%S')} [{tag}] {message}\n")
+
+class HandshakeCountingSSLObject(ssl.SSLObject):
+    """
+    SSLObject that counts failed server handshakes. The asyncio engine
+    handshakes inside asyncio.start_server, before handle_client_async runs,
+    so its failures never reach the handler; the SSL protocol does drive the
+    handshake through this object, though.
+    """
+
+    _handshake = None  # "pending" once started, then "done" or "failed"
+
+    def do_handshake(self):
+        self._handshake = "pending"
+        try:
+            super().do_handshake()
+        except (ssl.SSLWantReadError, ssl.SSLWantWriteError):
+            raise
+        except Exception:
+            self._handshake = "failed"
+            record_failed_handshake()
+            raise
+        self._handshake = "done"
+
+    def __del__(self):
+        # Timed out, or the client left mid-handshake: the protocol drops the
+        # object without do_handshake() ever raising
+        if self._handshake == "pending":
+            record_failed_handshake()
+
+def create_ssl_context(certfile=CERT_FILE, keyfile=KEY_FILE):
+    """Build the server-side TLS context shared by both server engines"""
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(certfile=certfile, keyfile=keyfile)
+    # Session tickets are encrypted with keys held by this context, so one
+    # context must be shared by every connection for resumption to work
+    context.num_tickets = SESSION_TICKETS
+    # Used by the asyncio engine only; the threaded engine counts in handle_client
+    context.sslobject_class = HandshakeCountingSSLObject
+    return context
+
+# TLS handshake counters: full handshakes versus resumed sessions
+handshake_stats = {"full": 0, "resumed": 0, "failed": 0}
+_handshake_lock = threading.Lock()
+
+def record_handshake(ssl_object):
+    """Count a completed handshake and return a short description of it"""
+    kind = "resumed" if ssl_object is not None and ssl_object.session_reused else "full"
+    with _handshake_lock:
+        handshake_stats[kind] += 1
+    HANDSHAKES[kind].inc()
+    return "TLS session resumed" if kind == "resumed" else "full TLS handshake"
+
+def record_failed_handshake():
+    with _handshake_lock:
+        handshake_stats["failed"] += 1
+    HANDSHAKES["failed"].inc()
+
+# Server Thread (thread-per-connection engine)
+def start_server(events, host=HOST, port=PORT, backlog=BACKLOG):
+    # Create a basic TCP socket
+    server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    
+    # Wrap the socket with SSL context
+    context = create_ssl_context()
+    
+    try:
+        server_socket.bind((host, port))
+        server_socket.listen(backlog)
+        events.log(f"Listening securely on {host}:{port}", "INFO")
+        events.update_status(f"Listening securely on {host}:{port}")
+    except Exception as e:
+        events.log(f"Failed to bind server socket: {str(e)}", "ERROR")
+        return
+
+    while True:
+        try:
+            client_socket, client_addr = server_socket.accept()
+
+            # Wrap client connection with SSL; the handshake itself runs on the
+            # client's thread so a slow client cannot hold up the accept loop
+            try:
+                ssl_client_socket = context.wrap_socket(client_socket, server_side=True,
+                                                        do_handshake_on_connect=False)
+                client_thread = threading.Thread(target=handle_client, args=(ssl_client_socket, events, client_addr))
+                client_thread.daemon = True
+                client_thread.start()
+            except Exception as e:
+                events.log(f"Could not start handler for {client_addr}: {str(e)}", "ERROR")
+                client_socket.close()
+        except Exception as e:
+            events.log(f"Error accepting client: {str(e)}", "ERROR")
+
+# Payload Processing (shared by both server engines)
+def resolve_location(reading, events, verbose=True):
+    """
+    Get the location name if needed. Names not available locally are
+    looked up in the background and filled in afterwards, so the
+    acknowledgment never waits on Nominatim.
+    """
+    if reading.location_name is None and reading.has_location():
+        started = time.perf_counter()
+        station_id, lat, lon = reading.station_id, reading.latitude, reading.longitude
+        name = location_worker.lookup(lat, lon, lambda name: backfill_location(station_id, lat, lon, name, events))
+        if name is not None:
+            reading.location_name = name
+            if verbose:
+                events.log(f"Resolved location: {name}", "INFO")
+        STAGE_GEOCODE.observe(time.perf_counter() - started)
+
+def store_reading(reading, events, verbose=True):
+    """Store one parsed reading, resolving its location name if needed; returns its station ID"""
+    station_id = reading.station_id
+    resolve_location(reading, events, verbose)
+
+    # Store data by station ID (this runs per reading, so the timers are
+    # skipped entirely while metrics are off)
+    started = time.perf_counter() if metrics.ENABLED else None
+    stations_data[station_id] = reading
+    station_history.record(reading)
+    # A display, if attached, picks this up on its next refresh tick
+    mark_station_changed(station_id)
+    if started is not None:
+        stored = time.perf_counter()
+        STAGE_STORE.observe(stored - started)
+    if ingest_log is not None or sqlite_store is not None:
+        if ingest_log is not None:
+            ingest_log.append(reading.to_dict())
+        if sqlite_store is not None:
+            sqlite_store.add(reading)
+        if started is not None:
+            STAGE_PERSIST.observe(time.perf_counter() - stored)
+    READINGS_STORED.inc()
+    return station_id
+
+class NotDurableError(Exception):
+    """Stored readings did not reach the ingest log on disk in time"""
+
+def wait_until_durable():
+    """
+    Block until every reading logged so far is fsynced, so an acknowledgment
+    never covers readings a crash could still lose. Raises NotDurableError
+    after ACK_SYNC_TIMEOUT; the handlers then drop the connection unacknowledged.
+    """
+    if ingest_log is None:
+        return
+    started = time.perf_counter()
+    durable = ingest_log.sync(timeout=ACK_SYNC_TIMEOUT)
+    STAGE_SYNC.observe(time.perf_counter() - started)
+    if not durable:
+        raise NotDurableError(f"ingest log did not reach disk within {ACK_SYNC_TIMEOUT}s "
+                              f"({ingest_log.last_error or 'flush too slow'})")
+
+def backfill_location(station_id, lat, lon, name, events):
+    """Called by the geocoding worker once a name is known; fills it into the latest reading"""
+    reading = stations_data.get(station_id)
+    if reading is None or reading.location_name is not None or (reading.latitude, reading.longitude) != (lat, lon):
+        return
+    reading.location_name = name
+    events.log(f"Resolved location for station {station_id}: {name}", "INFO")
+    mark_station_changed(station_id)
+
+def snapshot_readings():
+    """Latest reading of every station for an ingest log checkpoint, skipping any that cannot be encoded"""
+    snapshot = []
+    for reading in list(stations_data.values()):
+        try:
+            snapshot.append(reading.to_dict())
+        except (ValueError, OverflowError, OSError):
+            continue
+    return snapshot
+
+def open_ingest_log(events):
+    """
+    Replay the ingest log into memory, then start appending to it. Replay
+    only rebuilds the records that fit in the history (the newest ones of each
+    station, written by Reading.to_dict and so already valid) into the
+    history and the latest reading of their station; location names and
+    display updates are done once per station afterwards rather than once
+    per record.
+    """
+    global ingest_log
+    log = IngestLog(snapshot=snapshot_readings)
+    record_history = station_history.record
+
+    def restore(data_dict, is_checkpoint):
+        try:
+            reading = reading_from_dict(data_dict)
+        except (ValueError, TypeError, KeyError, IndexError):
+            return
+        if is_checkpoint:
+            # Latest state at segment rotation; the history already has these readings
+            if reading.station_id not in stations_data:
+                stations_data[reading.station_id] = reading
+        else:
+            stations_data[reading.station_id] = reading
+            record_history(reading)
+
+    started = time.perf_counter()
+    try:
+        count = log.replay(restore, keep=station_history.capacity)
+        log.start()
+    except OSError as e:
+        events.log(f"Ingest log unavailable, readings will not survive a restart: {str(e)}", "ERROR")
+        return
+    for reading in list(stations_data.values()):
+        resolve_location(reading, events, verbose=False)
+        mark_station_changed(reading.station_id)
+    events.log(f"Restored {len(stations_data)} station(s) from {count} logged record(s) "
+            f"in {time.perf_counter() - started:.2f}s", "INFO")
+    ingest_log = log
+
+def start_query_api(events, host=QUERY_API_HOST, port=QUERY_API_PORT):
+    """Thread target serving the HTTP query API"""
+    try:
+        service = QueryService(stations_data, station_versions, station_history, lambda: _version_counter)
+        httpd = make_query_server(service, host, port)
+    except OSError as e:
+        events.log(f"Failed to start query API on {host}:{port}: {str(e)}", "ERROR")
+        return
+    events.log(f"Query API listening on http://{host}:{port}/stations", "INFO")
+    httpd.serve_forever()
+
+class MissingBaseError(ValueError):
+    """A delta arrived for a station that has no reading to apply it to"""
+
+    def __init__(self, station_id):
+        super().__init__(f"delta for station {station_id} without a previous reading; full reading needed")
+        self.station_id = station_id
+
+def parse_document(item, received_at):
+    """
+    Reading from one document; deltas are merged onto the station's latest
+    reading. Raises ValueError for an invalid reading, MissingBaseError for
+    a delta the server cannot apply.
+    """
+    started = time.perf_counter() if metrics.ENABLED else None
+    try:
+        if isinstance(item, dict) and item.get(DELTA_KEY):
+            station_id = str(item.get("station_id"))
+            previous = stations_data.get(station_id)
+            if previous is None:
+                raise MissingBaseError(station_id)
+            item = apply_delta(previous, item)
+        return parse_reading(item, received_at)
+    except ValueError:
+        READINGS_REJECTED.inc()
+        raise
+    finally:
+        if started is not None:
+            STAGE_PARSE.observe(time.perf_counter() - started)
+
+def process_data(data, events, client_addr):
+    """
+    Parse one JSON document (a single reading or a batch) from a client,
+    validate and normalise its readings and store them by station ID.
+    Returns the acknowledgment to send back, or None if nothing should be sent.
+    """
+    started = time.perf_counter()
+    try:
+        document = json.loads(data)
+    except json.JSONDecodeError:
+        events.log(f"Weather Data Received from {client_addr}:", "DATA")
+        events.log(data, "DATA")
+        events.log("Invalid JSON format from client", "ERROR")
+        return None
+    STAGE_DECODE.observe(time.perf_counter() - started)
+
+    if isinstance(document, dict) and HELLO_KEY in document:
+        reply = answer_hello(document)
+        events.log(f"Negotiated encoding with {client_addr}: {reply.decode()}", "INFO")
+        return reply
+
+    seq, documents, is_batch = unpack_document(document)
+    received_at = time.time()
+    need_full = set()
+    if is_batch:
+        # One summary line per batch instead of several per reading
+        stored = []
+        for item in documents:
+            try:
+                stored.append(store_reading(parse_document(item, received_at), events, verbose=False))
+            except MissingBaseError as e:
+                need_full.add(e.station_id)
+            except ValueError:
+                pass
+        started = time.perf_counter()
+        events.log(f"Weather Data batch from {client_addr}: {len(stored)} reading(s) "
+                f"for {len(set(stored))} station(s)", "DATA")
+        if len(stored) < len(documents):
+            events.log(f"{len(documents) - len(stored)} invalid reading(s) in batch", "ERROR")
+        STAGE_LOG.observe(time.perf_counter() - started)
+        if stored:
+            wait_until_durable()
+    else:
+        started = time.perf_counter()
+        events.log(f"Weather Data Received from {client_addr}:", "DATA")
+        events.log(data, "DATA")
+        STAGE_LOG.observe(time.perf_counter() - started)
+        try:
+            station_id = store_reading(parse_document(documents[0], received_at), events)
+        except ValueError as e:
+            if isinstance(e, MissingBaseError):
+                need_full.add(e.station_id)
+            events.log(f"Rejected reading: {str(e)}", "ERROR")
+        else:
+            events.log(f"Updated data for station {station_id}", "INFO")
+            wait_until_durable()
+
+    return make_ack(seq, need_full)
+
+def process_binary(payload, events, client_addr, decoder):
+    """
+    Store the readings of one binary frame; decoder holds the connection's
+    station dictionary. Raises FrameError if the frame is malformed.
+    """
+    started = time.perf_counter()
+    seq, readings = decoder.decode(payload)
+    STAGE_DECODE.observe(time.perf_counter() - started)
+    received_at = time.time()
+    stored = []
+    for reading in readings:
+        if reading.time is None:
+            reading.time = received_at
+        stored.append(store_reading(reading, events, verbose=False))
+    started = time.perf_counter()
+    events.log(f"Weather Data (binary) from {client_addr}: {len(stored)} reading(s) "
+            f"for {len(set(stored))} station(s)", "DATA")
+    STAGE_LOG.observe(time.perf_counter() - started)
+    if stored:
+        wait_until_durable()
+    return make_ack(seq)
+
+def process_frame(payload, events, client_addr, decoder):
+    """Process one framed payload in either encoding; returns the acknowledgment"""
+    started = time.perf_counter()
+    BYTES_RECEIVED.inc(len(payload))
+    try:
+        if is_binary(payload):
+            FRAMES["binary"].inc()
+            return process_binary(payload, events, client_addr, decoder)
+        FRAMES["json"].inc()
+        return process_data(payload.decode("utf-8", errors="replace"), events, client_addr)
+    finally:
+        STAGE_FRAME.observe(time.perf_counter() - started)
+
+# Client Handler
+def handle_client(client_socket, events, client_addr):
+    try:
+        client_socket.settimeout(SSL_HANDSHAKE_TIMEOUT)
+        started = time.perf_counter()
+        client_socket.do_handshake()
+        STAGE_HANDSHAKE.observe(time.perf_counter() - started)
+    except (ssl.SSLError, OSError) as ssl_err:
+        record_failed_handshake()
+        events.log(f"SSL error with client {client_addr}: {str(ssl_err)}", "ERROR")
+        client_socket.close()
+        return
+
+    handshake = record_handshake(client_socket)
+    events.log(f"Secure client connected: {client_addr} ({handshake})", "CONNECT")
+    events.client_connected()
+    try:
+        client_socket.settimeout(CLIENT_IDLE_TIMEOUT)
+        header = recv_exact(client_socket, HEADER.size)
+        if header is None:
+            return
+        if is_legacy_header(header):
+            # Pre-framing client: one bare JSON document, one bare ack, then close
+            data = header + client_socket.recv(4096)
+            FRAMES["legacy"].inc()
+            BYTES_RECEIVED.inc(len(data))
+            ack = process_data(data.decode(), events, client_addr)
+            if ack:
+                client_socket.sendall(ack)
+                events.log(f"Sent acknowledgment to {client_addr}", "INFO")
+            return
+
+        # Framed client: keep serving readings until the client hangs up
+        decoder = BinaryDecoder()
+        payload = read_frame(client_socket, header)
+        while payload is not None:
+            ack = process_frame(payload, events, client_addr, decoder)
+            started = time.perf_counter()
+            client_socket.sendall(encode_frame(ack or ACK_ERROR))
+            STAGE_ACK.observe(time.perf_counter() - started)
+            events.log(f"Sent acknowledgment to {client_addr}", "INFO")
+            payload = read_frame(client_socket)
+    except socket.timeout:
+        events.log(f"Closing idle connection from {client_addr}", "INFO")
+    except FrameError as e:
+        PROTOCOL_ERRORS.inc()
+        events.log(f"Protocol error from {client_addr}: {str(e)}", "ERROR")
+    except NotDurableError as e:
+        events.log(f"Dropping {client_addr} without acknowledgment: {str(e)}", "ERROR")
+    except Exception as e:
+        events.log(f"Client error: {str(e)}", "ERROR")
+    finally:
+        client_socket.close()
+        events.client_disconnected()
+
+# Asyncio Server (event-loop engine)
+async def handle_client_async(reader, writer, events, limiter, executor):
+    """Serve one TLS client on the event loop; blocking work runs on the executor"""
+    client_addr = writer.get_extra_info("peername")
+    async with limiter:
+        handshake = record_handshake(writer.get_extra_info("ssl_object"))
+        events.log(f"Secure client connected: {client_addr} ({handshake})", "CONNECT")
+        events.client_connected()
+        loop = asyncio.get_running_loop()
+        try:
+            header = await asyncio.wait_for(reader.readexactly(HEADER.size), CLIENT_IDLE_TIMEOUT)
+            if is_legacy_header(header):
+                # Pre-framing client: one bare JSON document, one bare ack, then close
+                data = header + await asyncio.wait_for(reader.read(4096), CLIENT_IDLE_TIMEOUT)
+                FRAMES["legacy"].inc()
+                BYTES_RECEIVED.inc(len(data))
+                ack = await loop.run_in_executor(executor, process_data, data.decode(), events, client_addr)
+                if ack:
+                    writer.write(ack)
+                    await writer.drain()
+                    events.log(f"Sent acknowledgment to {client_addr}", "INFO")
+                return
+
+            # Framed client: keep serving readings until the client hangs up
+            decoder = BinaryDecoder()
+            payload = await asyncio.wait_for(read_frame_async(reader, header), CLIENT_IDLE_TIMEOUT)
+            while payload is not None:
+                ack = await loop.run_in_executor(executor, process_frame, payload, events, client_addr, decoder)
+                started = time.perf_counter()
+                writer.write(encode_frame(ack or ACK_ERROR))
+                await writer.drain()
+                STAGE_ACK.observe(time.perf_counter() - started)
+                events.log(f"Sent acknowledgment to {client_addr}", "INFO")
+                payload = await asyncio.wait_for(read_frame_async(reader), CLIENT_IDLE_TIMEOUT)
+        except asyncio.IncompleteReadError:
+            # Client connected and left without sending anything
+            pass
+        except asyncio.TimeoutError:
+            events.log(f"Closing idle connection from {client_addr}", "INFO")
+        except FrameError as e:
+            PROTOCOL_ERRORS.inc()
+            events.log(f"Protocol error from {client_addr}: {str(e)}", "ERROR")
+        except NotDurableError as e:
+            events.log(f"Dropping {client_addr} without acknowledgment: {str(e)}", "ERROR")
+        except Exception as e:
+            events.log(f"Client error: {str(e)}", "ERROR")
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except Exception:
+                pass
+            events.client_disconnected()
+
+async def serve_async(events, host=HOST, port=PORT, backlog=BACKLOG,
+                      max_concurrency=MAX_CONCURRENT_CLIENTS, worker_threads=WORKER_THREADS):
+    """Accept TLS clients with asyncio.start_server until cancelled"""
+    context = create_ssl_context()
+    limiter = asyncio.Semaphore(max_concurrency)
+    executor = ThreadPoolExecutor(max_workers=worker_threads, thread_name_prefix="ingest")
+
+    async def on_client(reader, writer):
+        await handle_client_async(reader, writer, events, limiter, executor)
+
+    try:
+        server = await asyncio.start_server(on_client, host, port, ssl=context, backlog=backlog,
+                                            ssl_handshake_timeout=SSL_HANDSHAKE_TIMEOUT)
+    except Exception as e:
+        events.log(f"Failed to bind server socket: {str(e)}", "ERROR")
+        executor.shutdown(wait=False)
+        return
+
+    events.log(f"Listening securely on {host}:{port} (asyncio, backlog {backlog}, "
+            f"max {max_concurrency} concurrent clients)", "INFO")
+    events.update_status(f"Listening securely on {host}:{port}")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        executor.shutdown(wait=False)
+
+def start_async_server(events, host=HOST, port=PORT, backlog=BACKLOG, max_concurrency=MAX_CONCURRENT_CLIENTS):
+    """Thread target that runs the asyncio engine on its own event loop"""
+    asyncio.run(serve_async(events, host, port, backlog, max_concurrency))
+
+# Startup and shutdown (shared by the headless and GUI entry points)
+def start_ingest(events, host=HOST, port=PORT, metrics_enabled=ENABLE_METRICS):
+    """Restore and open storage, then start the query API and the asyncio engine on daemon threads"""
+    global sqlite_store
+    metrics.set_enabled(metrics_enabled)
+    if ENABLE_INGEST_LOG:
+        open_ingest_log(events)
+    if ENABLE_SQLITE_STORE:
+        sqlite_store = SqliteStore(on_error=lambda message: events.log(message, "ERROR"))
+    if ENABLE_QUERY_API:
+        threading.Thread(target=start_query_api, args=(events,), daemon=True).start()
+    server_thread = threading.Thread(target=start_async_server, args=(events, host, port))
+    server_thread.daemon = True
+    server_thread.start()
+    return server_thread
+
+def stop_ingest():
+    """Flush and close the ingest log and the SQLite store"""
+    if ingest_log is not None:
+        ingest_log.close()
+    if sqlite_store is not None:
+        sqlite_store.close()
+
+# Headless Entry Point
+def main():
+    parser = argparse.ArgumentParser(description="Run the ingestion server without a GUI")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--log-level", choices=[name.lower() for name in LOG_FILTERS], default="info",
+                        help="least severe log events printed to stdout")
+    parser.add_argument("--no-metrics", action="store_true", help="record no counters or stage timings")
+    args = parser.parse_args()
+
+    events = IngestEvents()
+    events.subscribe(ConsoleSubscriber(LOG_FILTERS[args.log_level.capitalize()]))
+    server_thread = start_ingest(events, args.host, args.port, ENABLE_METRICS and not args.no_metrics)
+    try:
+        while server_thread.is_alive():
+            server_thread.join(1.0)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop_ingest()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,271 @@
+"""
+Durable append-only log of accepted readings.
+
+Every reading the server stores is appended to the active segment file in
+INGEST_LOG_DIR. Appends only buffer in memory; a flusher thread writes the
+buffer and fsyncs it every FLUSH_INTERVAL seconds (group commit). The server
+waits in sync() before acknowledging, so a crash only loses readings that
+were not acknowledged yet and the client still holds. A failed write keeps
+its records buffered and is retried in a new segment on the next flush; the
+flusher thread itself survives any error and keeps it in last_error.
+
+Segments are rotated at SEGMENT_SIZE bytes and only the newest MAX_SEGMENTS
+are kept. Each new segment starts with a checkpoint record holding the
+latest reading of every station, so stations that went quiet before the
+oldest retained segment are still restored.
+
+Record layout: payload length (uint32), CRC32 of the payload (uint32),
+kind (1 byte: READING or CHECKPOINT), then the JSON payload. Replay maps each
+segment into memory and stops at the first torn or corrupt record. When only
+the newest readings of each station are wanted, a first pass reads just the
+station IDs so older readings are skipped without decoding them.
+"""
+import json
+import mmap
+import os
+import struct
+import threading
+import zlib
+
+INGEST_LOG_DIR = "ingest_log"
+SEGMENT_SIZE = 64 * 1024 * 1024
+FLUSH_INTERVAL = 0.05
+MAX_SEGMENTS = 32
+
+RECORD_HEADER = struct.Struct(">IIB")
+READING = 1
+CHECKPOINT = 2
+
+SEGMENT_SUFFIX = ".wal"
+
+# Decodes replayed payloads without json.loads' per-call encoding detection
+_decoder = json.JSONDecoder()
+_decode = _decoder.decode
+
+# Start of every READING payload: Reading.to_dict puts the station ID first
+STATION_PREFIX = '{"station_id":'
+
+
+def encode_record(kind, obj):
+    payload = json.dumps(obj, separators=(",", ":")).encode("utf-8")
+    return RECORD_HEADER.pack(len(payload), zlib.crc32(payload), kind) + payload
+
+
+class IngestLog:
+    """Segmented write-ahead log with group-commit fsync"""
+
+    def __init__(self, directory=INGEST_LOG_DIR, segment_size=SEGMENT_SIZE,
+                 flush_interval=FLUSH_INTERVAL, max_segments=MAX_SEGMENTS, snapshot=None):
+        """
+        snapshot: optional callable returning the latest reading of every
+        station; written as the checkpoint at the start of each new segment.
+        """
+        self.directory = directory
+        self.segment_size = segment_size
+        self.flush_interval = flush_interval
+        self.max_segments = max(1, max_segments)
+        self.snapshot = snapshot
+        os.makedirs(directory, exist_ok=True)
+
+        self._buffer = []
+        self._generation = 0      # bumped by every append
+        self._durable = 0         # highest generation known to be fsynced
+        self._cond = threading.Condition()
+        self._io_lock = threading.Lock()
+        self._closed = False
+        self._file = None
+        self._reopen = False      # the segment was rotated or abandoned; the next flush opens a new one
+        self._segment_index = 0
+        self._flusher = None
+        self.last_error = None    # exception of the last failed background flush, if any
+
+    # ---------- Segments ----------
+
+    def segments(self):
+        """Segment paths, oldest first"""
+        names = sorted(name for name in os.listdir(self.directory) if name.endswith(SEGMENT_SUFFIX))
+        return [os.path.join(self.directory, name) for name in names]
+
+    def _open_next_segment(self):
+        existing = self.segments()
+        if existing:
+            last = os.path.basename(existing[-1])[:-len(SEGMENT_SUFFIX)]
+            self._segment_index = max(self._segment_index, int(last))
+        # Built before the file is opened, so a failing snapshot leaves no segment behind
+        checkpoint = encode_record(CHECKPOINT, self.snapshot()) if self.snapshot is not None else b""
+        self._segment_index += 1
+        path = os.path.join(self.directory, f"{self._segment_index:08d}{SEGMENT_SUFFIX}")
+        segment = open(path, "ab")
+        try:
+            segment.write(checkpoint)
+        except OSError:
+            segment.close()
+            raise
+        self._file = segment
+
+        # Retention: drop the oldest segments beyond MAX_SEGMENTS
+        for old in self.segments()[:-self.max_segments]:
+            try:
+                os.remove(old)
+            except OSError:
+                pass
+
+    # ---------- Writing ----------
+
+    def start(self):
+        """Open a fresh segment and start the flusher thread"""
+        with self._io_lock:
+            self._open_next_segment()
+        self._flusher = threading.Thread(target=self._flush_loop, name="ingest-log", daemon=True)
+        self._flusher.start()
+
+    def append(self, reading):
+        """Buffer one reading; returns a generation number that can be passed to sync()"""
+        record = encode_record(READING, reading)
+        with self._cond:
+            self._buffer.append(record)
+            self._generation += 1
+            return self._generation
+
+    def sync(self, generation=None, timeout=None):
+        """Block until everything up to generation (default: all appends so far) is on disk"""
+        with self._cond:
+            if generation is None:
+                generation = self._generation
+            return self._cond.wait_for(lambda: self._durable >= generation or self._closed, timeout)
+
+    def flush(self):
+        """
+        Write and fsync everything buffered so far. If that fails the records
+        stay buffered for the next attempt and the error is raised.
+        """
+        with self._io_lock:
+            with self._cond:
+                records, self._buffer = self._buffer, []
+                generation = self._generation
+            if records and (self._file is not None or self._reopen):
+                try:
+                    if self._file is None:
+                        self._open_next_segment()
+                        self._reopen = False
+                    self._file.write(b"".join(records))
+                    self._file.flush()
+                    os.fsync(self._file.fileno())
+                except Exception:
+                    with self._cond:
+                        self._buffer[:0] = records
+                    self._abandon_segment()
+                    raise
+                if self._file.tell() >= self.segment_size:
+                    # The records are durable; the next segment is opened by
+                    # the next flush, where a failure keeps its records buffered
+                    self._abandon_segment()
+        with self._cond:
+            self._durable = max(self._durable, generation)
+            self._cond.notify_all()
+
+    def _abandon_segment(self):
+        """
+        Stop writing to a segment, when it is full or after a failed write.
+        The retry goes to a new segment; whatever part of the records reached
+        this one is either a torn tail that replay stops at or a complete copy
+        that replay applies twice, like any retransmitted reading.
+        """
+        try:
+            self._file.close()
+        except (OSError, AttributeError):
+            pass
+        self._file = None
+        self._reopen = True
+
+    def _flush_loop(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._closed, self.flush_interval)
+                closed = self._closed
+            try:
+                self.flush()
+                self.last_error = None
+            except Exception as e:
+                # Retried on the next interval; sync() callers keep waiting
+                self.last_error = e
+            if closed:
+                return
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if self._flusher is not None:
+            self._flusher.join()
+        else:
+            self.flush()
+        with self._io_lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    # ---------- Replay ----------
+
+    def replay(self, apply, keep=None):
+        """
+        Feed every logged reading, oldest first, to apply(reading, is_checkpoint).
+        With keep, only the newest keep readings of each station are fed
+        (checkpoints always are). Returns the number of records read.
+        Call before start().
+        """
+        segments = [path for path in self.segments() if os.path.getsize(path) > 0]
+        skip = {}  # station ID -> older readings still to be skipped
+        if keep is not None:
+            totals = {}
+            for path in segments:
+                for kind, text in self._read_segment(path):
+                    if kind == READING:
+                        station_id = _station_id(text)
+                        totals[station_id] = totals.get(station_id, 0) + 1
+            skip = {station_id: total - keep for station_id, total in totals.items()
+                    if station_id is not None and total > keep}
+
+        count = 0
+        for path in segments:
+            for kind, text in self._read_segment(path):
+                count += 1
+                if kind == CHECKPOINT:
+                    for reading in _decode(text):
+                        apply(reading, True)
+                    continue
+                if skip:
+                    station_id = _station_id(text)
+                    remaining = skip.get(station_id)
+                    if remaining:
+                        skip[station_id] = remaining - 1
+                        continue
+                apply(_decode(text), False)
+        return count
+
+    def _read_segment(self, path):
+        """(kind, payload text) of each record, up to the first torn or corrupt one"""
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as view:
+            offset = 0
+            end = len(view)
+            header_size = RECORD_HEADER.size
+            while offset + header_size <= end:
+                length, crc, kind = RECORD_HEADER.unpack_from(view, offset)
+                start = offset + header_size
+                if start + length > end:
+                    break  # torn write at the tail of the segment
+                payload = view[start:start + length]
+                if zlib.crc32(payload) != crc:
+                    break
+                offset = start + length
+                yield kind, payload.decode("utf-8")
+
+
+def _station_id(text):
+    """Station ID of a READING payload without decoding the rest; None if it does not lead"""
+    if not text.startswith(STATION_PREFIX):
+        return None
+    try:
+        return _decoder.raw_decode(text, len(STATION_PREFIX))[0]
+    except ValueError:
+        return None
@@ -1,9 +1,10 @@
-import socket
 import requests
 import json
-import ssl
 import time
-from datetime import datetime
+
+from station_client import debug_print, send_to_server_secure
+from metrics import start_metrics_server
+from weather_api import OPEN_METEO_URL, fetch, next_poll_delay
 
 # ========== Configuration ==========
 
@@ -20,6 +21,9 @@ CERT_FILE = 'server.crt'  # Must be trusted by this client
 LATITUDE = 12.9716
 LONGITUDE = 77.5946
 
+# Port for a Prometheus /metrics endpoint of this client (None: not served)
+METRICS_PORT = None
+
 # Station identification (added for enhanced display)
 STATION_INFO = {
     "station_id": "WS-001",
@@ -28,12 +32,6 @@ STATION_INFO = {
 
 # ========== Utility Functions ==========
 
-def debug_print(header, message):
-    """Print debug information with a formatted header"""
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    print(f"\n===== {header} [{timestamp}] =====")
-    print(message)
-
 def format_value(value, unit=""):
     """Format a value with its unit for display"""
     if value is None:
@@ -48,14 +46,14 @@ def get_weather_data(latitude, longitude):
     Returns a Python dictionary ready to be converted into JSON.
     """
     url = (
-        f"https://api.open-meteo.com/v1/forecast?"
+        f"{OPEN_METEO_URL}?"
         f"latitude={latitude}&longitude={longitude}&current_weather=true"
     )
 
     try:
         debug_print("API REQUEST", f"Requesting data from Open-Meteo API:\n{url}")
-        response = requests.get(url, timeout=10)
-        response.raise_for_status()
+        # Pooled keep-alive session: later polls reuse the connection to Open-Meteo
+        response = fetch(url, timeout=10)
 
         data = response.json()
         debug_print("API RESPONSE", json.dumps(data, indent=4))
@@ -93,47 +91,6 @@ def get_weather_data(latitude, longitude):
 
     return None
 
-# ========== Secure Socket Connection ==========
-
-def send_to_server_secure(json_dict, server_ip, server_port, certfile):
-    """
-    Sends a JSON-formatted dictionary to the server securely using SSL.
-    Waits for an acknowledgment from the server.
-    """
-    try:
-        json_string = json.dumps(json_dict)
-
-        debug_print("SSL SETUP", f"Using certificate file: {certfile}")
-        context = ssl.create_default_context(ssl.Purpose.SERVER_AUTH, cafile=certfile)
-
-        debug_print("SOCKET", f"Connecting to SSL server {server_ip}:{server_port}...")
-        with socket.create_connection((server_ip, server_port), timeout=10) as raw_sock:
-            with context.wrap_socket(raw_sock, server_hostname=server_ip) as ssl_sock:
-                debug_print("SSL CONNECTION", "SSL handshake successful. Secure connection established.")
-                debug_print("CONNECTION INFO", f"Using cipher: {ssl_sock.cipher()}")
-                
-                # Send the JSON data
-                ssl_sock.sendall(json_string.encode('utf-8'))
-                debug_print("DATA SENT", "Secure JSON data sent successfully.")
-
-                # Wait for server acknowledgment
-                response = ssl_sock.recv(1024)
-                if response:
-                    debug_print("SERVER RESPONSE", response.decode())
-                else:
-                    debug_print("SERVER RESPONSE", "No response received from server.")
-
-    except ssl.SSLError as ssl_err:
-        debug_print("SSL ERROR", f"SSL error: {ssl_err}")
-    except socket.timeout:
-        debug_print("ERROR", "Socket connection timed out.")
-    except ConnectionRefusedError:
-        debug_print("ERROR", "Connection refused by the server. Is the server running?")
-    except FileNotFoundError:
-        debug_print("ERROR", f"Certificate file '{certfile}' not found.")
-    except Exception as e:
-        debug_print("ERROR", f"Unknown socket/SSL error: {str(e)}")
-
 # ========== Periodic Data Sending ==========
 
 def periodic_sender(interval=60):
@@ -141,7 +98,7 @@ def periodic_sender(interval=60):
     Periodically fetches weather data and sends it to the server.
     
     Args:
-        interval: Time in seconds between data transmissions
+        interval: Minimum time in seconds between data transmissions
     """
     try:
         while True:
@@ -151,14 +108,17 @@ def periodic_sender(interval=60):
             weather_data = get_weather_data(LATITUDE, LONGITUDE)
             
             if weather_data:
-                # Step 2: Send data securely using SSL
+                # Step 2: Send data securely using SSL (skipped if upstream has not updated)
                 send_to_server_secure(weather_data, SERVER_IP, SERVER_PORT, CERT_FILE)
+                # Open-Meteo refreshes current weather every 15 minutes; poll again just after that
+                delay = next_poll_delay(weather_data.get("time"), interval)
             else:
                 debug_print("WARNING", "Weather data could not be retrieved. Skipping this update.")
+                delay = interval
             
             # Wait for next interval
-            debug_print("SCHEDULER", f"Next update in {interval} seconds")
-            time.sleep(interval)
+            debug_print("SCHEDULER", f"Next update in {delay:.0f} seconds")
+            time.sleep(delay)
             
     except KeyboardInterrupt:
         debug_print("EXIT", "Client stopped by user (Ctrl+C).")
@@ -172,6 +132,10 @@ def main():
     print(" WEATHER MONITORING CLIENT (SSL MODE) ".center(60, "="))
     print("="*60 + "\n")
 
+    if METRICS_PORT:
+        start_metrics_server(METRICS_PORT)
+        debug_print("METRICS", f"Serving http://127.0.0.1:{METRICS_PORT}/metrics")
+
     mode = input("Run mode [O]nce or [C]ontinuous (default: Once)? ").lower()
     
     if mode == 'c':
@@ -196,8 +160,8 @@ def main():
             debug_print("EXIT", "Weather data could not be retrieved. Exiting client.")
             return
 
-        # Step 2: Send data securely using SSL
-        send_to_server_secure(weather_data, SERVER_IP, SERVER_PORT, CERT_FILE)
+        # Step 2: Send data securely using SSL and wait for the acknowledgment
+        send_to_server_secure(weather_data, SERVER_IP, SERVER_PORT, CERT_FILE, wait_for_ack=True)
 
         debug_print("DONE", "Client execution completed.")
 
@@ -0,0 +1,356 @@
+"""
+Wire protocol shared by the weather server and the station clients.
+
+A connection carries any number of frames. Each frame is a 4-byte big-endian
+payload length followed by the payload: a UTF-8 JSON document from a client,
+or an acknowledgment from the server. Clients that predate framing send a
+single bare JSON document and wait for a bare acknowledgment; the server
+recognises them by the leading '{' (a frame header would have to announce a
+payload of almost 2 GB to start with that byte).
+
+Framed clients may pipeline: each document carries a "seq" number and the
+server answers every frame, in order, with {"ack": seq}. A client keeps up to
+a window of unacknowledged documents in flight and resends them after a
+reconnect, so delivery is at-least-once; the server may see a document twice
+and stores it idempotently by station.
+
+A document is either a single reading or a batch: a JSON array of readings,
+or {"seq": n, "readings": [...]} when it needs to be acknowledged by number.
+A batch may mix stations and is acknowledged once as a whole.
+
+Framed clients may instead send readings in a compact binary encoding. They
+ask for it by sending {"hello": {"encodings": ["binary", ...]}} as their first
+frame; a server that supports it answers {"hello": {"encoding": "binary"}}
+(an older server just acknowledges the frame, and the client stays on JSON).
+JSON and binary frames can be mixed on one connection: a binary payload starts
+with BINARY_MAGIC, which no JSON document does. A binary frame is
+
+    header      magic, version, seq (0 = none), station count, reading count
+    stations    index, latitude, longitude (NaN if unknown), id, name
+    readings    station index, time, temperature, wind speed, direction, code
+
+with numbers in the units of reading.py and strings as a length byte plus
+UTF-8. Station IDs and names are sent once per connection: the stations block
+only defines indexes the server has not yet seen (or whose details changed),
+and later frames on the same connection refer to them by index.
+"""
+import asyncio
+import json
+import math
+import struct
+
+from reading import Reading
+
+# Frame header: payload length, unsigned 32-bit big-endian
+HEADER = struct.Struct(">I")
+
+# Largest payload we accept; anything bigger is treated as a protocol error
+MAX_FRAME_SIZE = 1024 * 1024
+
+# Acknowledgments sent back for each frame
+ACK_OK = b"Data received successfully!"
+ACK_ERROR = b"Invalid data"
+
+# Key a client adds to each document so the acknowledgment can be matched to it
+SEQ_KEY = "seq"
+
+# Key holding the list of readings in a batch document
+BATCH_KEY = "readings"
+
+# Key of an acknowledgment listing stations whose delta the server had no
+# reading to apply to; the client sends their next reading in full
+NEED_FULL_KEY = "need_full"
+
+
+# Binary frames: first payload byte, and the layout version that follows it
+BINARY_MAGIC = 0xB7
+BINARY_VERSION = 1
+BINARY_HEADER = struct.Struct(">BBQHH")
+BINARY_STATION = struct.Struct(">Hdd")
+BINARY_READING = struct.Struct(">HIffHB")
+
+# Stand-ins for missing direction and weather code in a binary reading
+NO_DIRECTION = 0xFFFF
+NO_CODE = 0xFF
+
+# Key of the encoding negotiation document
+HELLO_KEY = "hello"
+
+# Encodings this side can receive, most preferred first
+ENCODINGS = ("binary", "json")
+
+
+class FrameError(Exception):
+    """Raised when the peer sends something that is not a valid frame"""
+
+
+def encode_frame(payload):
+    """Prefix a payload (bytes or str) with its length"""
+    if isinstance(payload, str):
+        payload = payload.encode("utf-8")
+    if len(payload) > MAX_FRAME_SIZE:
+        raise FrameError(f"Frame of {len(payload)} bytes exceeds limit of {MAX_FRAME_SIZE}")
+    return HEADER.pack(len(payload)) + payload
+
+
+def unpack_document(document):
+    """
+    Split a decoded document into (seq, readings, is_batch).
+    The seq key is removed so it never ends up stored with a reading.
+    """
+    if isinstance(document, list):
+        return None, document, True
+    if not isinstance(document, dict):
+        return None, [document], False
+    seq = document.pop(SEQ_KEY, None)
+    readings = document.get(BATCH_KEY)
+    if isinstance(readings, list):
+        return seq, readings, True
+    return seq, [document], False
+
+
+def make_ack(seq, need_full=()):
+    """
+    Acknowledgment payload for a document; documents without a seq get the
+    plain ack unless some of their stations need a full reading.
+    """
+    if need_full:
+        return json.dumps({"ack": seq, NEED_FULL_KEY: sorted(need_full)}).encode()
+    if seq is None:
+        return ACK_OK
+    return json.dumps({"ack": seq}).encode()
+
+
+def parse_ack_reply(payload):
+    """(seq acknowledged or None for a plain ack, [station IDs that need a full reading])"""
+    if payload[:1] != b"{":
+        return None, []
+    try:
+        reply = json.loads(payload)
+        return reply.get("ack"), list(reply.get(NEED_FULL_KEY) or ())
+    except (ValueError, AttributeError, TypeError):
+        return None, []
+
+
+def parse_ack(payload):
+    """Return the seq acknowledged by an ack payload, or None for a plain ack"""
+    return parse_ack_reply(payload)[0]
+
+
+def make_hello(encodings=ENCODINGS):
+    """Encoding negotiation document a client sends as its first frame"""
+    return json.dumps({HELLO_KEY: {"encodings": list(encodings)}})
+
+
+def answer_hello(document):
+    """Server reply to a hello document: the first encoding both sides know"""
+    offered = document[HELLO_KEY].get("encodings", []) if isinstance(document[HELLO_KEY], dict) else []
+    chosen = next((name for name in offered if name in ENCODINGS), "json")
+    return json.dumps({HELLO_KEY: {"encoding": chosen}}).encode()
+
+
+def parse_hello_reply(payload):
+    """The encoding chosen by the server, or "json" if it did not understand the hello"""
+    try:
+        reply = json.loads(payload)
+        return reply[HELLO_KEY]["encoding"]
+    except (ValueError, KeyError, TypeError):
+        return "json"
+
+
+def is_binary(payload):
+    """True if a frame payload is in the binary encoding"""
+    return payload[:1] == b"\xb7"
+
+
+def _pack_text(text):
+    data = ("" if text is None else str(text)).encode("utf-8")
+    if len(data) > 255:
+        raise FrameError("Text longer than 255 bytes for a binary frame")
+    return bytes((len(data),)) + data
+
+
+def _unpack_text(payload, offset):
+    length = payload[offset]
+    end = offset + 1 + length
+    if end > len(payload):
+        raise FrameError("Binary frame truncated")
+    return payload[offset + 1:end].decode("utf-8", errors="replace"), end
+
+
+def _number(value):
+    return math.nan if value is None else value
+
+
+def _optional(value):
+    return None if value != value else value
+
+
+def _measurement(value):
+    # 32-bit floats carry about 7 digits; drop the noise they add to e.g. 31.2
+    return None if value != value else round(value, 3)
+
+
+class BinaryEncoder:
+    """
+    Client side of the binary encoding for one connection. Remembers which
+    stations the server already knows; use a fresh encoder after a reconnect.
+    """
+
+    def __init__(self):
+        self.indexes = {}  # station_id -> index
+        self.defined = {}  # index -> (name, latitude, longitude) as last sent
+
+    def encode(self, seq, readings):
+        """
+        Payload carrying readings (Reading objects) under one seq. Raises
+        FrameError, struct.error or OverflowError for readings the format
+        cannot carry exactly (long text, a weather code outside 0-254, a
+        fractional time or direction); the station dictionary is then left
+        as it was. Location names are not carried at all; see
+        StationConnection.encode.
+        """
+        stations = []
+        rows = []
+        indexes = {}  # stations first sent in this payload
+        defined = {}
+        for reading in readings:
+            index = self.indexes.get(reading.station_id, indexes.get(reading.station_id))
+            if index is None:
+                index = len(self.indexes) + len(indexes)
+                if index > 0xFFFF:
+                    raise FrameError("Too many stations for one binary connection")
+                indexes[reading.station_id] = index
+            details = (reading.station_name, reading.latitude, reading.longitude)
+            if defined.get(index, self.defined.get(index)) != details:
+                defined[index] = details
+                stations.append(BINARY_STATION.pack(index, _number(reading.latitude), _number(reading.longitude))
+                                + _pack_text(reading.station_id) + _pack_text(reading.station_name))
+            timestamp = reading.time
+            direction = reading.wind_direction
+            code = reading.weather_code
+            if timestamp is not None and timestamp != int(timestamp):
+                raise FrameError("Fractional time for a binary frame")
+            if direction is not None and direction != int(direction):
+                raise FrameError("Fractional wind direction for a binary frame")
+            if code is not None and not 0 <= code < NO_CODE:
+                raise FrameError(f"Weather code {code} out of range for a binary frame")
+            rows.append(BINARY_READING.pack(
+                index,
+                int(timestamp) if timestamp is not None else 0,
+                _number(reading.temperature),
+                _number(reading.wind_speed),
+                int(direction) % 360 if direction is not None else NO_DIRECTION,
+                code if code is not None else NO_CODE,
+            ))
+        header = BINARY_HEADER.pack(BINARY_MAGIC, BINARY_VERSION, seq or 0, len(stations), len(rows))
+        # Only now that the whole payload packed does the server get to know these stations
+        self.indexes.update(indexes)
+        self.defined.update(defined)
+        return header + b"".join(stations) + b"".join(rows)
+
+
+class BinaryDecoder:
+    """Server side of the binary encoding for one connection: the station dictionary"""
+
+    def __init__(self):
+        self.stations = {}  # index -> (station_id, name, latitude, longitude)
+
+    def decode(self, payload):
+        """(seq, readings) from a binary payload; raises FrameError if it is malformed"""
+        try:
+            magic, version, seq, station_count, reading_count = BINARY_HEADER.unpack_from(payload)
+        except struct.error:
+            raise FrameError("Binary frame truncated")
+        if magic != BINARY_MAGIC or version != BINARY_VERSION:
+            raise FrameError(f"Unsupported binary frame version {version}")
+
+        offset = BINARY_HEADER.size
+        try:
+            for _ in range(station_count):
+                index, latitude, longitude = BINARY_STATION.unpack_from(payload, offset)
+                station_id, offset = _unpack_text(payload, offset + BINARY_STATION.size)
+                name, offset = _unpack_text(payload, offset)
+                self.stations[index] = (station_id, name or None, _optional(latitude), _optional(longitude))
+        except (struct.error, IndexError):
+            raise FrameError("Binary frame truncated")
+
+        end = offset + reading_count * BINARY_READING.size
+        if end != len(payload):
+            raise FrameError("Binary frame length does not match its reading count")
+        stations = self.stations
+        readings = []
+        for index, timestamp, temperature, wind_speed, direction, code in \
+                BINARY_READING.iter_unpack(payload[offset:end]):
+            station = stations.get(index)
+            if station is None:
+                raise FrameError(f"Binary reading refers to undefined station {index}")
+            readings.append(Reading(
+                station_id=station[0],
+                station_name=station[1],
+                latitude=station[2],
+                longitude=station[3],
+                time=float(timestamp) if timestamp else None,
+                temperature=_measurement(temperature),
+                wind_speed=_measurement(wind_speed),
+                wind_direction=float(direction) if direction != NO_DIRECTION else None,
+                weather_code=code if code != NO_CODE else None,
+            ))
+        return (seq or None), readings
+
+
+def is_legacy_header(header):
+    """True if the first bytes of a connection are a bare JSON document, not a frame header"""
+    return header[:1] in (b"{", b"[")
+
+
+def parse_header(header):
+    """Return the payload length announced by a frame header"""
+    (length,) = HEADER.unpack(header)
+    if length > MAX_FRAME_SIZE:
+        raise FrameError(f"Frame of {length} bytes exceeds limit of {MAX_FRAME_SIZE}")
+    return length
+
+
+def recv_exact(sock, size):
+    """Read exactly size bytes from a blocking socket; None on a clean EOF before any byte"""
+    chunks = []
+    remaining = size
+    while remaining:
+        chunk = sock.recv(remaining)
+        if not chunk:
+            if remaining == size:
+                return None
+            raise FrameError("Connection closed in the middle of a frame")
+        chunks.append(chunk)
+        remaining -= len(chunk)
+    return b"".join(chunks)
+
+
+def read_frame(sock, header=None):
+    """Read one frame payload from a blocking socket; None when the peer has closed"""
+    if header is None:
+        header = recv_exact(sock, HEADER.size)
+        if header is None:
+            return None
+    length = parse_header(header)
+    payload = recv_exact(sock, length) if length else b""
+    if payload is None:
+        raise FrameError("Connection closed in the middle of a frame")
+    return payload
+
+
+async def read_frame_async(reader, header=None):
+    """Read one frame payload from an asyncio StreamReader; None when the peer has closed"""
+    if header is None:
+        try:
+            header = await reader.readexactly(HEADER.size)
+        except asyncio.IncompleteReadError as e:
+            if e.partial:
+                raise FrameError("Connection closed in the middle of a frame")
+            return None
+    length = parse_header(header)
+    try:
+        return await reader.readexactly(length)
+    except asyncio.IncompleteReadError:
+        raise FrameError("Connection closed in the middle of a frame")
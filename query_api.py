@@ -0,0 +1,189 @@
+"""
+Read-only HTTP/JSON API over the server's in-memory state.
+
+    GET /stations                      latest reading of every station
+    GET /stations?ids=WS-001,WS-002    latest readings of the listed stations
+    GET /stations/<id>                 latest reading of one station
+    GET /stations/<id>/history         recent history from the ring buffers;
+        ?since=<epoch>&until=<epoch>   optional time range
+        ?last=<n>                      or only the last n readings
+    GET /metrics                       counters and latency histograms of
+                                       the process, in Prometheus text format
+
+Responses carry an ETag derived from per-station change versions, so polls
+with If-None-Match get a bodyless 304 until the data changes. Bodies are
+encoded once per version and cached, gzip'ed when the client accepts it,
+and connections are kept alive (HTTP/1.1).
+"""
+import gzip
+import json
+import threading
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+
+import metrics
+
+QUERY_API_HOST = "127.0.0.1"
+QUERY_API_PORT = 9080
+
+# Encoded responses kept for reuse, by URL
+RESPONSE_CACHE_SIZE = 1024
+
+# Bodies smaller than this are not worth compressing
+GZIP_MIN_SIZE = 512
+
+
+class QueryError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def _clean(values):
+    """
+    Array column to a JSON-safe list (NaN becomes null). float32 columns are
+    rounded to 3 decimals, dropping the noise the widening to double adds
+    (31.2 would otherwise come out as 31.200000762939453).
+    """
+    if values.typecode == "f":
+        return [None if v != v else round(v, 3) for v in values]
+    return [None if v != v else v for v in values]
+
+
+class QueryService:
+    """Builds (etag, body) responses from the stations dict, versions and history"""
+
+    def __init__(self, stations, versions, history, current_version):
+        """
+        stations: station ID -> latest reading.Reading
+        versions: station ID -> number that changes whenever that station changes
+        history:  timeseries.HistoryStore
+        current_version: callable returning a number that changes whenever any station changes
+        """
+        self.stations = stations
+        self.versions = versions
+        self.history = history
+        self.current_version = current_version
+        self._cache = OrderedDict()  # url -> (etag, body, gzipped body or None)
+        self._lock = threading.Lock()
+
+    def etag(self, path, query):
+        parts = path.strip("/").split("/")
+        if parts == ["stations"]:
+            ids = self._requested_ids(query)
+            if ids is None:
+                return f'"all-{self.current_version()}"'
+            return '"' + "-".join(str(self.versions.get(i, 0)) for i in ids) + '"'
+        if len(parts) >= 2 and parts[0] == "stations":
+            station_id = unquote(parts[1])
+            return f'"{station_id}-{self.versions.get(station_id, 0)}"'
+        raise QueryError(404, "Unknown endpoint")
+
+    def _requested_ids(self, query):
+        ids = query.get("ids")
+        if not ids:
+            return None
+        return [i for i in ",".join(ids).split(",") if i]
+
+    def build(self, path, query):
+        parts = path.strip("/").split("/")
+        if parts == ["stations"]:
+            ids = self._requested_ids(query)
+            if ids is None:
+                return {station_id: reading.to_dict() for station_id, reading in list(self.stations.items())}
+            return {i: self.stations[i].to_dict() for i in ids if i in self.stations}
+        station_id = unquote(parts[1])
+        if station_id not in self.stations:
+            raise QueryError(404, f"Unknown station {station_id}")
+        if len(parts) == 2:
+            return self.stations[station_id].to_dict()
+        if len(parts) == 3 and parts[2] == "history":
+            try:
+                since = float(query["since"][0]) if "since" in query else None
+                until = float(query["until"][0]) if "until" in query else None
+                last = int(query["last"][0]) if "last" in query else None
+            except ValueError:
+                raise QueryError(400, "since/until must be numbers and last an integer")
+            columns = self.history.window(station_id, since=since, last=last) or {}
+            columns = {name: _clean(values) for name, values in columns.items()}
+            if until is not None and columns:
+                keep = sum(1 for t in columns["timestamp"] if t <= until)
+                columns = {name: values[:keep] for name, values in columns.items()}
+            return {"station_id": station_id, "columns": columns}
+        raise QueryError(404, "Unknown endpoint")
+
+    def respond(self, url):
+        """Return (etag, body, gzipped body or None) for a URL, reusing the cached encoding"""
+        split = urlsplit(url)
+        query = parse_qs(split.query)
+        etag = self.etag(split.path, query)
+        with self._lock:
+            cached = self._cache.get(url)
+            if cached is not None and cached[0] == etag:
+                self._cache.move_to_end(url)
+                return cached
+        body = json.dumps(self.build(split.path, query), separators=(",", ":")).encode("utf-8")
+        gzipped = gzip.compress(body, compresslevel=5) if len(body) >= GZIP_MIN_SIZE else None
+        entry = (etag, body, gzipped)
+        with self._lock:
+            self._cache[url] = entry
+            self._cache.move_to_end(url)
+            if len(self._cache) > RESPONSE_CACHE_SIZE:
+                self._cache.popitem(last=False)
+        return entry
+
+
+class QueryRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive
+    service = None  # set on the subclass created by make_query_server
+
+    def do_GET(self):
+        if urlsplit(self.path).path == "/metrics":
+            body = metrics.render().encode("utf-8")
+            self.send_body(200, body, content_type=metrics.CONTENT_TYPE)
+            return
+        try:
+            etag, body, gzipped = self.service.respond(self.path)
+        except QueryError as e:
+            self.send_body(e.status, json.dumps({"error": str(e)}).encode("utf-8"))
+            return
+
+        if etag in self.headers.get("If-None-Match", ""):
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        if gzipped is not None and "gzip" in self.headers.get("Accept-Encoding", ""):
+            self.send_body(200, gzipped, etag, encoding="gzip")
+        else:
+            self.send_body(200, body, etag)
+
+    def send_body(self, status, body, etag=None, encoding=None, content_type="application/json"):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Cache-Control", "no-cache")
+        if etag is not None:
+            self.send_header("ETag", etag)
+        if encoding is not None:
+            self.send_header("Content-Encoding", encoding)
+        self.send_header("Vary", "Accept-Encoding")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Polls are far too frequent to log
+        pass
+
+
+class QueryHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024  # listen backlog; the default of 5 drops bursts of polls
+
+
+def make_query_server(service, host=QUERY_API_HOST, port=QUERY_API_PORT):
+    handler = type("BoundQueryRequestHandler", (QueryRequestHandler,), {"service": service})
+    return QueryHTTPServer((host, port), handler)
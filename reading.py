@@ -0,0 +1,233 @@
+"""
+Typed weather reading, parsed and normalised once at ingest.
+
+Clients send documents such as
+    {"station_id": "WS-001", "location": [12.97, 77.59], "time": "2025-04-19T10:00",
+     "temperature": "31.2 °C", "windspeed": "12 km/h", "wind_direction": "270°",
+     "weather_code": 1}
+parse_reading turns one into a Reading with plain numeric fields in fixed
+units: temperature in °C, wind speed in km/h, wind direction in degrees and
+time in epoch seconds (UTC). Numbers may arrive bare or as strings with a
+unit; °F, K, m/s, mph and knots are converted. Missing or unreadable values
+become None. Fields the model does not know are kept in `extra`.
+
+A client may send a delta instead: a document with "delta": true that carries
+only station_id, time and the fields that changed since its previous reading.
+apply_delta fills in the rest from the previous reading of that station.
+"""
+import math
+import re
+import time
+from datetime import datetime, timezone
+
+_QUANTITY = re.compile(r"\s*([-+]?\d*\.?\d+(?:[eE][-+]?\d+)?)\s*(.*?)\s*$")
+
+# Factors converting speed units to km/h
+SPEED_UNITS = {"": 1.0, "km/h": 1.0, "kmh": 1.0, "kph": 1.0, "m/s": 3.6, "mph": 1.609344,
+               "kn": 1.852, "kt": 1.852, "knots": 1.852}
+
+# Times format_timestamp can render: datetime covers the years 1 to 9999
+MIN_TIMESTAMP = datetime.min.replace(tzinfo=timezone.utc).timestamp()
+MAX_TIMESTAMP = datetime.max.replace(tzinfo=timezone.utc).timestamp()
+
+# Marks a document that only carries the fields that changed
+DELTA_KEY = "delta"
+
+# Keys parse_reading understands; everything else goes to extra
+KNOWN_KEYS = frozenset(("station_id", "station_name", "location", "location_name", "time",
+                        "temperature", "windspeed", "wind_speed", "wind_direction", "weather_code",
+                        DELTA_KEY))
+
+
+def parse_quantity(value):
+    """(number, unit) from 31.2 or "31.2 °C"; (None, "") if there is no number"""
+    if isinstance(value, bool):
+        return None, ""
+    if isinstance(value, (int, float)):
+        return (float(value), "") if value == value else (None, "")
+    if isinstance(value, str):
+        match = _QUANTITY.match(value)
+        if match:
+            return float(match.group(1)), match.group(2).lower()
+    return None, ""
+
+
+def parse_number(value):
+    """Number from a value such as 31.2 or "31.2 °C"; None if there is none"""
+    return parse_quantity(value)[0]
+
+
+def parse_temperature(value):
+    """Temperature in °C"""
+    number, unit = parse_quantity(value)
+    if number is None:
+        return None
+    unit = unit.lstrip("°")
+    if unit in ("f", "fahrenheit"):
+        return (number - 32.0) * 5.0 / 9.0
+    if unit in ("k", "kelvin"):
+        return number - 273.15
+    return number
+
+
+def parse_speed(value):
+    """Speed in km/h"""
+    number, unit = parse_quantity(value)
+    if number is None:
+        return None
+    return number * SPEED_UNITS.get(unit, 1.0)
+
+
+def parse_timestamp(value, default=None):
+    """Epoch seconds from an ISO time ("2025-04-19T10:00", read as UTC) or a number"""
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    if isinstance(value, str):
+        try:
+            parsed = datetime.fromisoformat(value)
+        except ValueError:
+            pass
+        else:
+            if parsed.tzinfo is None:
+                parsed = parsed.replace(tzinfo=timezone.utc)
+            return parsed.timestamp()
+    return time.time() if default is None else default
+
+
+def format_timestamp(timestamp):
+    """ISO UTC time as the clients send it, with seconds only when needed"""
+    moment = datetime.fromtimestamp(timestamp, timezone.utc).replace(tzinfo=None)
+    return moment.isoformat(timespec="minutes" if moment.second == 0 and not moment.microsecond else "seconds")
+
+
+class Reading:
+    """One weather reading with numeric, unit-normalised fields"""
+
+    __slots__ = ("station_id", "station_name", "latitude", "longitude", "location_name",
+                 "time", "temperature", "wind_speed", "wind_direction", "weather_code", "extra")
+
+    def __init__(self, station_id, station_name=None, latitude=None, longitude=None, location_name=None,
+                 time=None, temperature=None, wind_speed=None, wind_direction=None, weather_code=None,
+                 extra=None):
+        self.station_id = station_id
+        self.station_name = station_name
+        self.latitude = latitude
+        self.longitude = longitude
+        self.location_name = location_name
+        self.time = time
+        self.temperature = temperature
+        self.wind_speed = wind_speed
+        self.wind_direction = wind_direction
+        self.weather_code = weather_code
+        self.extra = extra
+
+    def __repr__(self):
+        return f"Reading({self.to_dict()!r})"
+
+    def has_location(self):
+        return self.latitude is not None and self.longitude is not None
+
+    def to_dict(self):
+        """JSON-friendly dict; parse_reading(reading.to_dict()) gives the reading back"""
+        data = {"station_id": self.station_id}
+        if self.station_name is not None:
+            data["station_name"] = self.station_name
+        if self.has_location():
+            data["location"] = [self.latitude, self.longitude]
+        if self.location_name is not None:
+            data["location_name"] = self.location_name
+        if self.time is not None:
+            data["time"] = format_timestamp(self.time)
+        data["temperature"] = self.temperature
+        data["wind_speed"] = self.wind_speed
+        data["wind_direction"] = self.wind_direction
+        data["weather_code"] = self.weather_code
+        if self.extra:
+            data.update(self.extra)
+        return data
+
+
+def parse_reading(data, received_at=None):
+    """
+    Validate a decoded JSON reading and build a Reading from it.
+    Raises ValueError if it is not an object with a station_id, or if a number
+    is infinite or the time is outside the years 1 to 9999.
+    Readings without a time are stamped with received_at (default: now).
+    """
+    if not isinstance(data, dict):
+        raise ValueError("Reading is not a JSON object")
+    station_id = data.get("station_id")
+    if station_id is None or isinstance(station_id, (dict, list)):
+        raise ValueError("Reading without station ID")
+
+    latitude = longitude = None
+    location_name = data.get("location_name")
+    location = data.get("location")
+    if isinstance(location, (list, tuple)) and len(location) >= 2:
+        latitude = parse_number(location[0])
+        longitude = parse_number(location[1])
+    elif isinstance(location, str) and location_name is None:
+        location_name = location
+
+    code = parse_number(data.get("weather_code"))
+    timestamp = parse_timestamp(data.get("time"), received_at)
+    temperature = parse_temperature(data.get("temperature"))
+    wind_speed = parse_speed(data.get("wind_speed", data.get("windspeed")))
+    wind_direction = parse_number(data.get("wind_direction"))
+    numbers = (latitude, longitude, timestamp, temperature, wind_speed, wind_direction, code)
+    if not all(math.isfinite(number) for number in numbers if number is not None):
+        raise ValueError("Reading with an infinite number")
+    if not MIN_TIMESTAMP <= timestamp < MAX_TIMESTAMP:
+        raise ValueError("Reading time out of range")
+    extra = {key: value for key, value in data.items() if key not in KNOWN_KEYS} or None
+
+    return Reading(
+        station_id=str(station_id),
+        station_name=data.get("station_name"),
+        latitude=latitude,
+        longitude=longitude,
+        location_name=location_name,
+        time=timestamp,
+        temperature=temperature,
+        wind_speed=wind_speed,
+        wind_direction=wind_direction,
+        weather_code=int(code) if code is not None else None,
+        extra=extra,
+    )
+
+
+def reading_from_dict(data):
+    """
+    Reading from a dict made by Reading.to_dict, such as an ingest log record.
+    Its values are already validated and in fixed units, so only the time is
+    parsed; a few times faster than parse_reading. Raises ValueError, TypeError,
+    KeyError or IndexError for anything to_dict could not have produced.
+    """
+    location = data.get("location")
+    moment = datetime.fromisoformat(data["time"]) if "time" in data else None
+    extra = {key: value for key, value in data.items() if key not in KNOWN_KEYS} or None
+    return Reading(
+        station_id=data["station_id"],
+        station_name=data.get("station_name"),
+        latitude=location[0] if location is not None else None,
+        longitude=location[1] if location is not None else None,
+        location_name=data.get("location_name"),
+        time=moment.replace(tzinfo=timezone.utc).timestamp() if moment is not None else None,
+        temperature=data["temperature"],
+        wind_speed=data["wind_speed"],
+        wind_direction=data["wind_direction"],
+        weather_code=data["weather_code"],
+        extra=extra,
+    )
+
+
+def apply_delta(previous, delta):
+    """Full reading document: the previous Reading of the station updated with a delta document"""
+    data = previous.to_dict()
+    if "location" in delta:
+        data.pop("location_name", None)  # resolved for the old coordinates
+    if "windspeed" in delta:
+        data.pop("wind_speed")
+    data.update(delta)
+    del data[DELTA_KEY]
+    return data
@@ -1,17 +1,21 @@
-import socket
-import threading
 import tkinter as tk
 from tkinter import scrolledtext
 from tkinter import ttk
 import time
-import json
-import ssl
+from collections import deque
 from datetime import datetime
-import requests
+from ingest import (LOG_FILTERS, LOG_LEVELS, IngestEvents, IngestSubscriber, start_ingest, stations_data,
+                    stop_ingest, take_changed_stations)
+from reading import parse_timestamp
 
-# Server Configuration
-HOST = '0.0.0.0'
-PORT = 9000
+# GUI log pipeline: network threads enqueue records, the Tk thread drains them
+LOG_FLUSH_INTERVAL_MS = 100   # how often queued records are written to the widget
+LOG_BATCH_LIMIT = 2000        # records written per flush at most
+LOG_QUEUE_LIMIT = 20000       # records buffered between flushes; oldest are dropped beyond this
+MAX_LOG_LINES = 5000          # lines kept in the log widget; older lines are trimmed
+
+# The data viewer applies station changes at this rate instead of on every message
+VIEWER_REFRESH_INTERVAL_MS = 100  # 10 Hz
 
 # Weather code translation dictionary
 WEATHER_CODES = {
@@ -45,41 +49,11 @@ WEATHER_CODES = {
     99: "Thunderstorm with heavy hail"
 }
 
-# Global dictionary to store data from all weather stations
-stations_data = {}
-
-# Function to get location name from coordinates
-def get_location_name(lat, lon):
-    """Get location name from coordinates using Nominatim API"""
-    try:
-        url = f"https://nominatim.openstreetmap.org/reverse?lat={lat}&lon={lon}&format=json"
-        headers = {
-            "User-Agent": "WeatherMonitoringServer/1.0"
-        }
-        response = requests.get(url, headers=headers, timeout=5)
-        if response.status_code == 200:
-            data = response.json()
-            if "address" in data:
-                address = data["address"]
-                # Try to construct a sensible location name
-                if "city" in address:
-                    return address["city"]
-                elif "town" in address:
-                    return address["town"]
-                elif "village" in address:
-                    return address["village"]
-                elif "suburb" in address:
-                    return address["suburb"]
-                elif "county" in address:
-                    return address["county"]
-                else:
-                    return f"{address.get('state', '')}, {address.get('country', '')}"
-        return "Unknown Location"
-    except Exception:
-        return "Unknown Location"
+# Keys shown in the viewer's summary rather than its detailed section
+DETAIL_SKIP_KEYS = ("temperature", "humidity", "pressure", "station_name", "location", "station_id")
 
 # GUI Class for Main Server Window
-class WeatherServerGUI:
+class WeatherServerGUI(IngestSubscriber):
     def __init__(self, root):
         self.root = root
         self.root.title("🌤️ Weather Monitoring Server")
@@ -103,6 +77,14 @@ class WeatherServerGUI:
                                      command=self.open_data_viewer)
         self.view_button.pack(side=tk.RIGHT, padx=10)
         
+        # Log level filter
+        self.log_filter_var = tk.StringVar(value="All")
+        self.log_filter = ttk.Combobox(header_frame, textvariable=self.log_filter_var,
+                                       values=list(LOG_FILTERS), state="readonly", width=8)
+        self.log_filter.pack(side=tk.RIGHT)
+        self.log_filter.bind("<<ComboboxSelected>>", self.on_log_filter_selected)
+        ttk.Label(header_frame, text="Log level:").pack(side=tk.RIGHT, padx=5)
+        
         # Scrolled text area for logs
         self.text_area = scrolledtext.ScrolledText(root, wrap=tk.WORD, width=90, height=25, 
                                                   font=("Consolas", 11))
@@ -140,6 +122,14 @@ class WeatherServerGUI:
         self.clients_connected = 0
         self.data_viewer = None
 
+        # Log records and status updates from network threads wait here until
+        # the Tk thread picks them up; deque appends and pops are thread-safe
+        self.log_queue = deque(maxlen=LOG_QUEUE_LIMIT)
+        self.min_log_level = LOG_FILTERS["All"]
+        self.status_queue = deque(maxlen=1)
+        self.root.after(LOG_FLUSH_INTERVAL_MS, self.flush_logs)
+        self.root.after(VIEWER_REFRESH_INTERVAL_MS, self.apply_station_changes)
+
     def setup_styles(self):
         style = ttk.Style()
         style.configure("Header.TLabel", font=("Helvetica", 18, "bold"), foreground="darkblue")
@@ -147,14 +137,55 @@ class WeatherServerGUI:
         style.configure("Connection.TLabel", font=("Helvetica", 10), foreground="#007acc")
 
     def log(self, message, tag="INFO"):
-        self.text_area.config(state=tk.NORMAL)
-        self.text_area.insert(tk.END, f"{time.strftime('%H:%M:%S')} - {message}\n", tag)
-        self.text_area.yview(tk.END)
-        self.text_area.config(state=tk.DISABLED)
+        """Queue a log line; safe to call from any thread"""
+        if LOG_LEVELS.get(tag, 20) >= self.min_log_level:
+            self.log_queue.append((f"{time.strftime('%H:%M:%S')} - {message}\n", tag))
 
     def update_status(self, message):
-        self.status_var.set(f"Status: {message}")
-        self.connection_var.set(f"Connections: {self.clients_connected}")
+        """Queue a status bar update; safe to call from any thread"""
+        self.status_queue.append(message)
+
+    def connections_changed(self, count):
+        """Remember the connection count shown with the next status update; safe to call from any thread"""
+        self.clients_connected = count
+
+    def flush_logs(self):
+        """Write queued log records to the widget in one batch (runs on the Tk thread)"""
+        chunks = []
+        try:
+            for _ in range(LOG_BATCH_LIMIT):
+                line, tag = self.log_queue.popleft()
+                chunks.append(line)
+                chunks.append(tag)
+        except IndexError:
+            pass
+
+        if chunks:
+            self.text_area.config(state=tk.NORMAL)
+            self.text_area.insert(tk.END, *chunks)
+            # Keep the widget a fixed-size ring by trimming the oldest lines
+            excess = int(self.text_area.index("end-1c").split(".")[0]) - MAX_LOG_LINES
+            if excess > 0:
+                self.text_area.delete("1.0", f"{excess + 1}.0")
+            self.text_area.yview(tk.END)
+            self.text_area.config(state=tk.DISABLED)
+
+        if self.status_queue:
+            status = self.status_queue.popleft()
+            self.status_var.set(f"Status: {status}")
+            self.connection_var.set(f"Connections: {self.clients_connected}")
+
+        self.root.after(LOG_FLUSH_INTERVAL_MS, self.flush_logs)
+
+    def apply_station_changes(self):
+        """Hand the stations changed since the last tick to the viewer (runs on the Tk thread)"""
+        changed = take_changed_stations()
+        if changed and self.data_viewer is not None and self.data_viewer.is_alive():
+            self.data_viewer.apply_station_changes(changed)
+        self.root.after(VIEWER_REFRESH_INTERVAL_MS, self.apply_station_changes)
+
+    def on_log_filter_selected(self, event):
+        self.min_log_level = LOG_FILTERS.get(self.log_filter_var.get(), 0)
     
     def open_data_viewer(self):
         if self.data_viewer is None or not self.data_viewer.is_alive():
@@ -315,6 +346,13 @@ class WeatherDataDisplay:
         self.data_frame.bind("<Configure>", 
                              lambda e: self.data_canvas.configure(scrollregion=self.data_canvas.bbox("all")))
         
+        # Make the data rows span the full width
+        self.data_frame.columnconfigure(0, weight=1)
+        
+        # Rows of the detailed section by key: [frame, value label, displayed text]
+        self.data_rows = {}
+        self.data_row_order = []
+        
         # Status frame
         self.status_frame = ttk.Frame(main_frame, style="Status.TFrame")
         self.status_frame.pack(fill=tk.X, pady=5)
@@ -330,6 +368,9 @@ class WeatherDataDisplay:
         # Placeholder for storing the last received data timestamp
         self.last_update_time = None
         
+        # Dropdown entries by station ID
+        self.station_choices = {}
+        
         # Refresh the station list initially
         self.refresh_station_list()
 
@@ -367,15 +408,26 @@ class WeatherDataDisplay:
         self.update_time()
         self.window.after(1000, self.clock_tick)
     
+    def station_choice(self, station_id, reading):
+        return f"{reading.station_name or 'Unknown Station'} ({station_id})"
+    
+    def selected_station_id(self):
+        """Extract station ID from selection (format: "Station Name (ID)")"""
+        selection = self.station_var.get()
+        if selection == "No stations available":
+            return None
+        return selection.split("(")[-1].rstrip(")")
+    
     def refresh_station_list(self):
         """Update the station dropdown with available stations"""
+        self.station_choices = {station_id: self.station_choice(station_id, reading)
+                                for station_id, reading in list(stations_data.items())}
+        self.show_station_choices()
+    
+    def show_station_choices(self):
         current_selection = self.station_var.get()
         
-        station_names = []
-        for station_id, data in stations_data.items():
-            station_name = data.get("station_name", "Unknown Station")
-            station_names.append(f"{station_name} ({station_id})")
-        
+        station_names = list(self.station_choices.values())
         if not station_names:
             station_names = ["No stations available"]
         
@@ -390,110 +442,121 @@ class WeatherDataDisplay:
             if station_names[0] != "No stations available":
                 self.on_station_selected(None)
     
+    def apply_station_changes(self, changed):
+        """
+        Apply a batch of changed station IDs. The dropdown is only rebuilt when
+        a station appears or is renamed, and the detail panel only when the
+        selected station changed, so the cost follows the batch, not the fleet.
+        """
+        list_changed = False
+        for station_id in changed:
+            reading = stations_data.get(station_id)
+            if reading is None:
+                continue
+            choice = self.station_choice(station_id, reading)
+            if self.station_choices.get(station_id) != choice:
+                self.station_choices[station_id] = choice
+                list_changed = True
+        if list_changed:
+            self.show_station_choices()
+        
+        station_id = self.selected_station_id()
+        if station_id in changed and station_id in stations_data:
+            self.update_data(stations_data[station_id])
+    
     def on_station_selected(self, event):
         """Handle station selection from dropdown"""
-        selection = self.station_var.get()
-        if selection == "No stations available":
-            return
-        
-        # Extract station ID from selection (format: "Station Name (ID)")
-        station_id = selection.split("(")[-1].rstrip(")")
-        
+        station_id = self.selected_station_id()
         if station_id in stations_data:
             self.update_data(stations_data[station_id])
     
-    def update_data(self, data_dict):
+    def update_data(self, reading):
         # Update the last update time
         self.last_update_time = datetime.now()
         self.status_var.set(f"Last updated: {self.last_update_time.strftime('%H:%M:%S')}")
         
         # Update station info if available
-        if "station_name" in data_dict:
-            self.station_label.config(text=data_dict["station_name"])
-        if "location" in data_dict:
-            if isinstance(data_dict["location"], list) and len(data_dict["location"]) >= 2:
-                # We have coordinates, get location name
-                lat, lon = data_dict["location"][0], data_dict["location"][1]
-                location_name = data_dict.get("location_name", get_location_name(lat, lon))
-                self.location_var.set(f"Location: {location_name} ({lat}, {lon})")
-            else:
-                self.location_var.set(f"Location: {data_dict['location']}")
-        if "station_id" in data_dict:
-            self.id_var.set(f"Station ID: {data_dict['station_id']}")
+        if reading.station_name is not None:
+            self.station_label.config(text=reading.station_name)
+        if reading.has_location():
+            location_name = reading.location_name or "Resolving..."
+            self.location_var.set(f"Location: {location_name} ({reading.latitude}, {reading.longitude})")
+        elif reading.location_name is not None:
+            self.location_var.set(f"Location: {reading.location_name}")
+        self.id_var.set(f"Station ID: {reading.station_id}")
         
         # Update weather condition (translate code to description)
-        if "weather_code" in data_dict:
-            weather_code = data_dict["weather_code"]
-            try:
-                if isinstance(weather_code, (int, str)) and int(weather_code) in WEATHER_CODES:
-                    weather_desc = WEATHER_CODES[int(weather_code)]
-                    self.weather_condition_var.set(f"Weather Condition: {weather_desc} (Code: {weather_code})")
-                else:
-                    self.weather_condition_var.set(f"Weather Condition: Unknown (Code: {weather_code})")
-            except (ValueError, TypeError):
-                self.weather_condition_var.set(f"Weather Condition: {weather_code}")
-        
-        # Update summary values
-        if "temperature" in data_dict:
-            self.temp_var.set(f"{data_dict['temperature']}" if not isinstance(data_dict['temperature'], (int, float)) 
-                             else f"{data_dict['temperature']:.1f}°C")
-        
-        # Update wind speed (from 'windspeed' or 'wind_speed')
-        wind_key = "windspeed" if "windspeed" in data_dict else "wind_speed"
-        if wind_key in data_dict:
-            self.wind_var.set(f"{data_dict[wind_key]}" if not isinstance(data_dict[wind_key], (int, float)) 
-                             else f"{data_dict[wind_key]:.1f} m/s")
-        
-        # Update wind direction
-        if "wind_direction" in data_dict:
-            self.wind_dir_var.set(f"{data_dict['wind_direction']}" if not isinstance(data_dict['wind_direction'], (int, float)) 
-                                else f"{data_dict['wind_direction']}°")
-        
-        # Clear old data in the detailed section
-        for widget in self.data_frame.winfo_children():
-            widget.destroy()
-        
-        # Re-create labels for all data
-        row = 0
+        weather_code = reading.weather_code
+        if weather_code in WEATHER_CODES:
+            self.weather_condition_var.set(f"Weather Condition: {WEATHER_CODES[weather_code]} (Code: {weather_code})")
+        elif weather_code is not None:
+            self.weather_condition_var.set(f"Weather Condition: Unknown (Code: {weather_code})")
+        else:
+            self.weather_condition_var.set("Weather Condition: N/A")
+        
+        # Update summary values (already numeric and in °C, km/h and degrees)
+        self.temp_var.set("N/A" if reading.temperature is None else f"{reading.temperature:.1f}°C")
+        self.wind_var.set("N/A" if reading.wind_speed is None else f"{reading.wind_speed:.1f} km/h")
+        self.wind_dir_var.set("N/A" if reading.wind_direction is None else f"{reading.wind_direction:.0f}°")
+        
+        data_dict = reading.to_dict()
+        
+        # Update the detailed section in place: only labels whose value changed
+        # are touched, and rows are only created or destroyed when keys come or go
+        shown_keys = []
         for key, value in data_dict.items():
             # Skip the ones we've already handled in the summary
-            if key in ["temperature", "humidity", "pressure", "station_name", "location", "station_id"]:
+            if key in DETAIL_SKIP_KEYS:
                 continue
-                
-            # Create a frame for each data pair
-            pair_frame = ttk.Frame(self.data_frame, style="Main.TFrame")
-            pair_frame.grid(row=row, column=0, sticky="ew", padx=5, pady=5)
-            
-            # Make the frame span the full width
-            self.data_frame.columnconfigure(0, weight=1)
-            
-            # Key label
-            formatted_key = key.replace("_", " ").title()
-            label_key = ttk.Label(pair_frame, text=f"{formatted_key}:", style="DataKey.TLabel")
-            label_key.pack(side=tk.LEFT, padx=10)
+            shown_keys.append(key)
             
-            # Value processing for special cases
-            display_value = value
-            if key == "weather_code" and isinstance(value, (int, str)):
-                try:
-                    code_int = int(value)
-                    if code_int in WEATHER_CODES:
-                        display_value = f"{value} ({WEATHER_CODES[code_int]})"
-                except (ValueError, TypeError):
-                    pass
-            elif key == "time":
-                # Format time if it's an ISO timestamp
-                try:
-                    if isinstance(value, str) and 'T' in value:
-                        display_value = datetime.now().strftime("%B %d, %Y %H:%M:%S")
-                except (ValueError, TypeError):
-                    pass
-                    
-            # Value label
-            label_value = ttk.Label(pair_frame, text=str(display_value), style="DataValue.TLabel", wraplength=400)
-            label_value.pack(side=tk.RIGHT, padx=10, fill=tk.X, expand=True)
-            
-            row += 1
+            text = str(self.format_detail_value(key, value))
+            row = self.data_rows.get(key)
+            if row is None:
+                row = self.data_rows[key] = self.create_data_row(key, text)
+            elif row[2] != text:
+                row[1].config(text=text)
+                row[2] = text
+        
+        for key in [key for key in self.data_rows if key not in shown_keys]:
+            self.data_rows.pop(key)[0].destroy()
+        
+        # Re-grid only when the set or order of keys changed
+        if shown_keys != self.data_row_order:
+            for index, key in enumerate(shown_keys):
+                self.data_rows[key][0].grid(row=index, column=0, sticky="ew", padx=5, pady=5)
+            self.data_row_order = shown_keys
+    
+    def create_data_row(self, key, text):
+        """Build one key/value row of the detailed section; returns [frame, value label, text]"""
+        # Create a frame for each data pair
+        pair_frame = ttk.Frame(self.data_frame, style="Main.TFrame")
+        
+        # Key label
+        formatted_key = key.replace("_", " ").title()
+        label_key = ttk.Label(pair_frame, text=f"{formatted_key}:", style="DataKey.TLabel")
+        label_key.pack(side=tk.LEFT, padx=10)
+        
+        # Value label
+        label_value = ttk.Label(pair_frame, text=text, style="DataValue.TLabel", wraplength=400)
+        label_value.pack(side=tk.RIGHT, padx=10, fill=tk.X, expand=True)
+        return [pair_frame, label_value, text]
+    
+    def format_detail_value(self, key, value):
+        """Value processing for special cases in the detailed section"""
+        display_value = value
+        if key == "weather_code" and value in WEATHER_CODES:
+            display_value = f"{value} ({WEATHER_CODES[value]})"
+        elif key == "time":
+            # Show the reading's own time in local time
+            display_value = datetime.fromtimestamp(parse_timestamp(value)).strftime("%B %d, %Y %H:%M:%S")
+        elif value is None:
+            display_value = "N/A"
+        elif key == "wind_speed":
+            display_value = f"{value:.1f} km/h"
+        elif key == "wind_direction":
+            display_value = f"{value:.0f}°"
+        return display_value
     
     def is_alive(self):
         """Check if window is still open"""
@@ -502,92 +565,15 @@ class WeatherDataDisplay:
         except:
             return False
 
-# Server Thread
-def start_server(gui):
-    # Create a basic TCP socket
-    server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    
-    # Wrap the socket with SSL context
-    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
-    context.load_cert_chain(certfile="server.crt", keyfile="server.key")
-    
-    try:
-        server_socket.bind((HOST, PORT))
-        server_socket.listen(5)
-        gui.log(f"Listening securely on {HOST}:{PORT}", "INFO")
-        gui.update_status(f"Listening securely on {HOST}:{PORT}")
-    except Exception as e:
-        gui.log(f"Failed to bind server socket: {str(e)}", "ERROR")
-        return
-
-    while True:
-        try:
-            client_socket, client_addr = server_socket.accept()
-
-            # Wrap client connection with SSL
-            try:
-                ssl_client_socket = context.wrap_socket(client_socket, server_side=True)
-                gui.clients_connected += 1
-                gui.log(f"Secure client connected: {client_addr}", "CONNECT")
-                gui.update_status(f"{gui.clients_connected} client(s) connected")
-
-                client_thread = threading.Thread(target=handle_client, args=(ssl_client_socket, gui, client_addr))
-                client_thread.daemon = True
-                client_thread.start()
-            except ssl.SSLError as ssl_err:
-                gui.log(f"SSL error with client {client_addr}: {str(ssl_err)}", "ERROR")
-                client_socket.close()
-        except Exception as e:
-            gui.log(f"Error accepting client: {str(e)}", "ERROR")
-
-# Client Handler
-def handle_client(client_socket, gui, client_addr):
-    try:
-        data = client_socket.recv(4096).decode()
-        if data:
-            gui.log(f"Weather Data Received from {client_addr}:", "DATA")
-            gui.log(data, "DATA")
-            try:
-                data_dict = json.loads(data)
-                
-                # Check if we have location coordinates and get location name if needed
-                if "location" in data_dict and isinstance(data_dict["location"], list) and len(data_dict["location"]) >= 2:
-                    lat, lon = data_dict["location"][0], data_dict["location"][1]
-                    if "location_name" not in data_dict:
-                        data_dict["location_name"] = get_location_name(lat, lon)
-                        gui.log(f"Resolved location: {data_dict['location_name']}", "INFO")
-                
-                # Store data by station ID
-                if "station_id" in data_dict:
-                    station_id = data_dict["station_id"]
-                    stations_data[station_id] = data_dict
-                    gui.log(f"Updated data for station {station_id}", "INFO")
-                else:
-                    gui.log("Received data without station ID", "ERROR")
-                
-                # Update display if it's open
-                if gui.data_viewer and gui.data_viewer.is_alive():
-                    # Refresh the station list
-                    gui.data_viewer.refresh_station_list()
-                
-                # Send acknowledgment back to client
-                client_socket.sendall("Data received successfully!".encode())
-                gui.log(f"Sent acknowledgment to {client_addr}", "INFO")
-                
-            except json.JSONDecodeError:
-                gui.log("Invalid JSON format from client", "ERROR")
-    except Exception as e:
-        gui.log(f"Client error: {str(e)}", "ERROR")
-    finally:
-        client_socket.close()
-        gui.clients_connected = max(0, gui.clients_connected - 1)
-        gui.update_status(f"{gui.clients_connected} client(s) connected")
-
-# Entry Point
+# Entry Point: the GUI attaches to the ingestion core as a subscriber
+# (run ingest.py instead for a node without a display)
 if __name__ == "__main__":
     root = tk.Tk()
     gui = WeatherServerGUI(root)
-    server_thread = threading.Thread(target=start_server, args=(gui,))
-    server_thread.daemon = True
-    server_thread.start()
-    root.mainloop()
\ No newline at end of file
+    events = IngestEvents()
+    events.subscribe(gui)
+    start_ingest(events)
+    try:
+        root.mainloop()
+    finally:
+        stop_ingest()
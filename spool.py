@@ -0,0 +1,160 @@
+"""
+Client-side spool for readings that could not be delivered.
+
+When the server cannot be reached, station clients append the readings to a
+local append-only file, one JSON document per line, fsynced so an outage
+followed by a crash still loses nothing. Once the server is back the backlog
+is sent in large batches, oldest first. Retries are spaced with exponential
+backoff and full jitter, so a fleet of clients does not stampede a server that
+has just restarted.
+
+The spool is capped at max_bytes; when it grows past the cap the oldest
+readings are evicted. Delivery is at-least-once: readings that were sent but
+not yet removed from the file when a client dies are sent again.
+"""
+import json
+import os
+import random
+import time
+
+# Directory holding the spool files, relative to the working directory
+SPOOL_DIR = "spool"
+
+# Size cap of one spool file; past it the oldest readings are dropped
+SPOOL_MAX_BYTES = 50 * 1024 * 1024
+
+# Eviction trims the spool to this share of the cap, so it does not run on every append
+SPOOL_EVICT_TO = 0.75
+
+# Readings sent per drain step; each step is acknowledged before the next
+SPOOL_DRAIN_BATCH = 5000
+
+# Retry backoff: the delay before retry n is random in [0, min(cap, base * 2**n)]
+RETRY_BASE = 5.0
+RETRY_CAP = 600.0
+
+
+class Backoff:
+    """Exponential backoff with full jitter"""
+
+    def __init__(self, base=RETRY_BASE, cap=RETRY_CAP):
+        self.base = base
+        self.cap = cap
+        self.failures = 0
+        self.next_attempt = 0.0
+
+    def ready(self):
+        return time.monotonic() >= self.next_attempt
+
+    def failed(self):
+        """Record a failed attempt; returns the delay before the next one"""
+        delay = random.uniform(0, min(self.cap, self.base * 2 ** self.failures))
+        self.failures += 1
+        self.next_attempt = time.monotonic() + delay
+        return delay
+
+    def succeeded(self):
+        self.failures = 0
+        self.next_attempt = 0.0
+
+
+class Spool:
+    """Append-only JSON-lines file of undelivered readings, read oldest first"""
+
+    def __init__(self, path, max_bytes=SPOOL_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.offset = 0  # bytes at the head of the file already delivered
+        self.evicted = 0
+        self.backoff = Backoff()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._discard_torn_tail()
+
+    def _discard_torn_tail(self):
+        """Drop a half-written last line left by a crash during append"""
+        try:
+            with open(self.path, "rb+") as f:
+                data = f.read()
+                if data and not data.endswith(b"\n"):
+                    f.truncate(data.rfind(b"\n") + 1)
+        except FileNotFoundError:
+            pass
+
+    def _size(self):
+        try:
+            return os.path.getsize(self.path)
+        except FileNotFoundError:
+            return 0
+
+    def has_backlog(self):
+        return self._size() > self.offset
+
+    def pending_bytes(self):
+        return max(0, self._size() - self.offset)
+
+    def append(self, documents):
+        """Durably add documents to the end of the spool"""
+        if not documents:
+            return
+        data = b"".join(json.dumps(document).encode("utf-8") + b"\n" for document in documents)
+        with open(self.path, "ab") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        if self._size() - self.offset > self.max_bytes:
+            self._rewrite(int(self.max_bytes * SPOOL_EVICT_TO))
+
+    def peek(self, limit=SPOOL_DRAIN_BATCH):
+        """(documents, end) for up to limit of the oldest readings; pass end to consume"""
+        documents = []
+        try:
+            with open(self.path, "rb") as f:
+                f.seek(self.offset)
+                while len(documents) < limit:
+                    line = f.readline()
+                    if not line:
+                        break
+                    try:
+                        documents.append(json.loads(line))
+                    except ValueError:
+                        pass  # a damaged line cannot be delivered; skip it
+                end = f.tell()
+        except FileNotFoundError:
+            return [], self.offset
+        return documents, end
+
+    def consume(self, end):
+        """Forget everything before end (readings the server has acknowledged)"""
+        self.offset = end
+        if self.offset >= self._size():
+            with open(self.path, "wb"):
+                pass
+            self.offset = 0
+
+    def compact(self):
+        """Rewrite the spool without the consumed head, so a restart does not resend it"""
+        if self.offset:
+            self._rewrite(None)
+
+    def _rewrite(self, keep_bytes):
+        """Rewrite the unconsumed part, keeping only its newest keep_bytes (None: all of it)"""
+        with open(self.path, "rb") as f:
+            f.seek(self.offset)
+            lines = f.readlines()
+        dropped = 0
+        if keep_bytes is not None:
+            total = sum(len(line) for line in lines)
+            while dropped < len(lines) and total > keep_bytes:
+                total -= len(lines[dropped])
+                dropped += 1
+        self.evicted += dropped
+
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "wb") as f:
+            f.writelines(lines[dropped:])
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.path)
+        self.offset = 0
@@ -0,0 +1,210 @@
+"""
+Optional SQLite storage of every reading.
+
+Readings handed to add() are queued and written by a single writer thread in
+batched transactions (up to BATCH_SIZE rows, at least every FLUSH_INTERVAL
+seconds), never one INSERT per message. The database runs in WAL mode so
+queries proceed while the writer commits, and readings are indexed on
+(station_id, time) so range queries stay fast on large tables. The index is
+unique and rows are inserted with INSERT OR IGNORE, so a reading delivered
+twice (a retransmit or a spool drain) is stored once.
+
+A batch the writer cannot commit is retried WRITE_RETRIES times and then
+dropped; every failure is reported to the on_error callback.
+"""
+import json
+import queue
+import sqlite3
+import threading
+import time
+
+
+DATABASE_FILE = "weather.db"
+BATCH_SIZE = 1000
+FLUSH_INTERVAL = 0.5
+BULK_CHUNK_SIZE = 50000
+WRITE_RETRIES = 3
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS readings (
+    station_id TEXT NOT NULL,
+    time REAL NOT NULL,
+    temperature REAL,
+    wind_speed REAL,
+    wind_direction REAL,
+    weather_code INTEGER,
+    data TEXT NOT NULL
+);
+"""
+INDEX = "CREATE UNIQUE INDEX IF NOT EXISTS readings_station_time ON readings (station_id, time)"
+INSERT = "INSERT OR IGNORE INTO readings VALUES (?, ?, ?, ?, ?, ?, ?)"
+# Keeps the first copy of every (station_id, time), as INSERT OR IGNORE does
+DEDUPLICATE = "DELETE FROM readings WHERE rowid NOT IN (SELECT MIN(rowid) FROM readings GROUP BY station_id, time)"
+
+_STOP = object()
+
+
+def reading_to_row(reading):
+    """Row tuple for the readings table from a reading.Reading"""
+    return (
+        reading.station_id,
+        reading.time,
+        reading.temperature,
+        reading.wind_speed,
+        reading.wind_direction,
+        reading.weather_code,
+        json.dumps(reading.to_dict(), separators=(",", ":")),
+    )
+
+
+def connect(path):
+    connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=NORMAL")
+    return connection
+
+
+def create_index(connection):
+    """
+    Create the unique (station_id, time) index if it is missing. Duplicates
+    loaded without it, or kept by the non-unique index of older databases,
+    are deleted first.
+    """
+    row = connection.execute("SELECT sql FROM sqlite_master WHERE type = 'index' "
+                             "AND name = 'readings_station_time'").fetchone()
+    if row is not None and "UNIQUE" in row[0].upper():
+        return
+    with connection:
+        if row is not None:
+            connection.execute("DROP INDEX readings_station_time")
+        connection.execute(DEDUPLICATE)
+        connection.execute(INDEX)
+
+
+class SqliteStore:
+    """Batched single-writer SQLite store of readings"""
+
+    def __init__(self, path=DATABASE_FILE, batch_size=BATCH_SIZE, flush_interval=FLUSH_INTERVAL, on_error=None):
+        """on_error: optional callable(message) told about every failed write"""
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.on_error = on_error
+        self._queue = queue.SimpleQueue()
+        self._local = threading.local()
+        self.rows_written = 0
+        self.batches_written = 0
+        self.rows_dropped = 0
+
+        connection = connect(path)
+        try:
+            connection.executescript(SCHEMA)
+            create_index(connection)
+        finally:
+            connection.close()
+        self._writer = threading.Thread(target=self._write_loop, name="sqlite-writer", daemon=True)
+        self._writer.start()
+
+    def add(self, reading):
+        """Queue one reading.Reading for the writer thread"""
+        self._queue.put(reading_to_row(reading))
+
+    def _write_loop(self):
+        connection = connect(self.path)
+        running = True
+        while running:
+            try:
+                row = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            rows = []
+            while row is not _STOP:
+                rows.append(row)
+                if len(rows) >= self.batch_size:
+                    break
+                try:
+                    row = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+            else:
+                running = False
+            if rows:
+                self._write_batch(connection, rows)
+        connection.close()
+
+    def _write_batch(self, connection, rows):
+        """Commit one batch, retrying a failed write before dropping the batch"""
+        for attempt in range(1, WRITE_RETRIES + 1):
+            try:
+                with connection:
+                    connection.executemany(INSERT, rows)
+            except sqlite3.Error as e:
+                if attempt < WRITE_RETRIES:
+                    self._report(f"SQLite write of {len(rows)} row(s) failed, retrying: {e}")
+                    time.sleep(self.flush_interval * attempt)
+                    continue
+                self.rows_dropped += len(rows)
+                self._report(f"SQLite write of {len(rows)} row(s) failed {WRITE_RETRIES} times, "
+                             f"batch dropped: {e}")
+                return
+            self.rows_written += len(rows)
+            self.batches_written += 1
+            return
+
+    def _report(self, message):
+        if self.on_error is not None:
+            self.on_error(message)
+
+    def close(self):
+        """Write everything still queued and stop the writer"""
+        self._queue.put(_STOP)
+        self._writer.join()
+
+    def bulk_load(self, readings, rebuild_index=True):
+        """
+        Load a large iterable of reading.Reading objects directly, in BULK_CHUNK_SIZE
+        transactions. The index is dropped and rebuilt once at the end,
+        which is much faster than maintaining it row by row.
+        Returns the number of rows loaded.
+        """
+        connection = connect(self.path)
+        count = 0
+        try:
+            connection.execute("PRAGMA synchronous=OFF")
+            if rebuild_index:
+                connection.execute("DROP INDEX IF EXISTS readings_station_time")
+            chunk = []
+            for reading in readings:
+                chunk.append(reading_to_row(reading))
+                if len(chunk) >= BULK_CHUNK_SIZE:
+                    with connection:
+                        connection.executemany(INSERT, chunk)
+                    count += len(chunk)
+                    chunk = []
+            if chunk:
+                with connection:
+                    connection.executemany(INSERT, chunk)
+                count += len(chunk)
+        finally:
+            if rebuild_index:
+                create_index(connection)
+            connection.close()
+        return count
+
+    def _reader(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = self._local.connection = connect(self.path)
+        return connection
+
+    def query(self, station_id, start=None, end=None, limit=None):
+        """Reading dicts of a station with start <= time <= end (epoch seconds), oldest first"""
+        sql = "SELECT data FROM readings WHERE station_id = ? AND time >= ? AND time <= ? ORDER BY time"
+        params = [station_id, float("-inf") if start is None else start, float("inf") if end is None else end]
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        return [json.loads(data) for (data,) in self._reader().execute(sql, params)]
+
+    def count(self):
+        return self._reader().execute("SELECT COUNT(*) FROM readings").fetchone()[0]
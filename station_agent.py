@@ -0,0 +1,192 @@
+"""
+One client process for many weather stations.
+
+Reads the station list from a JSON config (stations.json by default), fetches
+current weather for all of them with one multi-coordinate Open-Meteo request
+per FETCH_CHUNK stations, and pushes the readings to the server as batches
+over a single persistent connection. This replaces running one
+my_socket_*.py process per station. The chunks are fetched concurrently over
+a pooled keep-alive session (see weather_api.py). Readings that cannot be
+delivered are spooled to disk and sent when the server is back (see spool.py).
+Readings whose upstream time has not moved since the last cycle are not sent
+again, and the next cycle is scheduled for just after Open-Meteo's next
+update of current_weather, with the configured interval as the minimum.
+
+Run:
+    python station_agent.py                # continuous, interval from the config
+    python station_agent.py --once         # one cycle, wait for acknowledgment
+    python station_agent.py --config other_stations.json --interval 300
+    python station_agent.py --metrics-port 9101   # also serve Prometheus /metrics
+"""
+import argparse
+import json
+import time
+
+import requests
+
+from metrics import start_metrics_server
+from spool import SPOOL_MAX_BYTES, Spool
+from station_client import WIRE_ENCODING, ChangeTracker, StationConnection, debug_print, deliver, spool_path
+from weather_api import FETCH_CONCURRENCY, fetch_concurrently, fetch_current_weather, next_poll_delay
+
+# ========== Configuration ==========
+
+# Station list used when --config is not given
+CONFIG_FILE = "stations.json"
+
+# Stations per Open-Meteo request; keeps the URL to a sensible length
+FETCH_CHUNK = 100
+
+# Defaults for config entries that are left out
+DEFAULT_SERVER = {"host": "localhost", "port": 9000, "certfile": "server.crt"}
+DEFAULT_INTERVAL = 60
+
+# ========== Config ==========
+
+def load_config(path=CONFIG_FILE):
+    """Read the agent config; raises ValueError if a station is missing required fields"""
+    with open(path, encoding="utf-8") as f:
+        config = json.load(f)
+
+    stations = config.get("stations", [])
+    for station in stations:
+        missing = [key for key in ("station_id", "latitude", "longitude") if key not in station]
+        if missing:
+            raise ValueError(f"Station {station} is missing {', '.join(missing)}")
+    return {
+        "server": dict(DEFAULT_SERVER, **config.get("server", {})),
+        "interval": config.get("interval", DEFAULT_INTERVAL),
+        "concurrency": config.get("concurrency", FETCH_CONCURRENCY),
+        "spool": config.get("spool", spool_path("agent")),
+        "spool_max_bytes": config.get("spool_max_bytes", SPOOL_MAX_BYTES),
+        "stations": stations,
+    }
+
+# ========== Weather API Fetching ==========
+
+def build_reading(station, current):
+    """Reading document for one station from its Open-Meteo current_weather block"""
+    temperature = current.get("temperature")
+    windspeed = current.get("windspeed")
+    wind_direction = current.get("winddirection")
+    weather_code = current.get("weathercode")
+    return {
+        "station_id": station["station_id"],
+        "station_name": station.get("station_name", station["station_id"]),
+        "location": [station["latitude"], station["longitude"]],
+        "time": current.get("time"),
+        "temperature": f"{temperature} °C" if temperature is not None else "N/A",
+        "windspeed": f"{windspeed} km/h" if windspeed is not None else "N/A",
+        "wind_direction": f"{wind_direction}°" if wind_direction is not None else "N/A",
+        "weather_code": weather_code if weather_code is not None else "N/A",
+    }
+
+def fetch_chunk(stations):
+    """Readings for several stations from one multi-coordinate Open-Meteo request"""
+    currents = fetch_current_weather([station["latitude"] for station in stations],
+                                     [station["longitude"] for station in stations])
+    return [build_reading(station, current) for station, current in zip(stations, currents)]
+
+def fetch_all(stations, concurrency=FETCH_CONCURRENCY):
+    """
+    Readings for every station that could be fetched. Chunks are requested
+    concurrently, up to concurrency at a time; failed chunks are skipped.
+    """
+    chunks = [stations[start:start + FETCH_CHUNK] for start in range(0, len(stations), FETCH_CHUNK)]
+    readings = []
+    for chunk, result, error in fetch_concurrently(fetch_chunk, chunks, concurrency):
+        if error is None:
+            readings.extend(result)
+        elif isinstance(error, requests.exceptions.Timeout):
+            debug_print("ERROR", f"API request timed out for {len(chunk)} station(s).")
+        elif isinstance(error, requests.exceptions.ConnectionError):
+            debug_print("ERROR", "Failed to connect to API server.")
+        elif isinstance(error, requests.exceptions.HTTPError):
+            debug_print("ERROR", f"HTTP error: {error}")
+        else:
+            debug_print("ERROR", f"Unknown error fetching weather data: {str(error)}")
+    return readings
+
+# ========== Agent ==========
+
+def run_cycle(connection, stations, tracker, spool=None, wait_for_ack=False, concurrency=FETCH_CONCURRENCY):
+    """
+    Fetch every station once and hand the new readings to the connection (or
+    the spool). Returns the fetched readings.
+    """
+    started = time.perf_counter()
+    fetched_readings = fetch_all(stations, concurrency)
+    fetched = time.perf_counter()
+    if not fetched_readings:
+        debug_print("WARNING", "No weather data could be retrieved. Skipping this update.")
+        return fetched_readings
+
+    tracker.forget(connection.take_need_full())
+    readings = [document for document in map(tracker.prepare, fetched_readings) if document is not None]
+    if not readings:
+        debug_print("SKIPPED", f"No new upstream readings for {len(fetched_readings)} station(s); nothing sent.")
+        return fetched_readings
+    if deliver(connection, readings, spool, wait_for_ack):
+        debug_print("DATA SENT", f"{len(readings)}/{len(stations)} station(s): fetched in "
+                    f"{fetched - started:.2f}s, sent in {time.perf_counter() - fetched:.2f}s "
+                    f"({len(connection.pending)} batch(es) awaiting acknowledgment)")
+    return fetched_readings
+
+def next_cycle_delay(readings, interval):
+    """Seconds until the next cycle: just after the earliest expected upstream update"""
+    if not readings:
+        return interval
+    return min(next_poll_delay(reading.get("time"), interval) for reading in readings)
+
+def run_agent(config, once=False, interval=None):
+    server = config["server"]
+    stations = config["stations"]
+    interval = interval or config["interval"]
+    concurrency = config["concurrency"]
+    connection = StationConnection(server["host"], server["port"], server["certfile"])
+    spool = Spool(config["spool"], config["spool_max_bytes"])
+    tracker = ChangeTracker(deltas=WIRE_ENCODING != "binary")
+    debug_print("AGENT", f"{len(stations)} station(s) -> {server['host']}:{server['port']}")
+
+    try:
+        while True:
+            readings = []
+            try:
+                readings = run_cycle(connection, stations, tracker, spool, wait_for_ack=once,
+                                     concurrency=concurrency)
+            except Exception as e:
+                # Undelivered readings are in the spool and go out with a later cycle
+                debug_print("ERROR", f"Could not send readings: {str(e)}")
+            if once:
+                break
+            delay = next_cycle_delay(readings, interval)
+            debug_print("SCHEDULER", f"Next update in {delay:.0f} seconds")
+            time.sleep(delay)
+    except KeyboardInterrupt:
+        debug_print("EXIT", "Agent stopped by user (Ctrl+C).")
+    finally:
+        connection.close()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--config", default=CONFIG_FILE, help="station list (JSON)")
+    parser.add_argument("--once", action="store_true", help="run one cycle and exit")
+    parser.add_argument("--interval", type=int, help="seconds between cycles (overrides the config)")
+    parser.add_argument("--concurrency", type=int, help="Open-Meteo requests in flight at once (overrides the config)")
+    parser.add_argument("--metrics-port", type=int, help="serve Prometheus metrics on this port")
+    args = parser.parse_args()
+
+    try:
+        config = load_config(args.config)
+    except (OSError, ValueError) as e:
+        debug_print("CONFIG ERROR", str(e))
+        return
+    if args.concurrency:
+        config["concurrency"] = args.concurrency
+    if args.metrics_port:
+        start_metrics_server(args.metrics_port)
+        debug_print("METRICS", f"Serving http://127.0.0.1:{args.metrics_port}/metrics")
+    run_agent(config, once=args.once, interval=args.interval)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,512 @@
+"""
+Shared plumbing for the weather station clients (my_socket_*.py).
+
+Readings are sent as length-prefixed frames (see protocol.py) over one
+persistent TLS connection per server. The TLS context is built once per
+certificate file and the session of the last connection is offered on
+reconnect, so the server can resume it instead of doing a full handshake.
+Sends are pipelined: every reading gets
+a sequence number and up to ACK_WINDOW of them may be in flight before the
+client waits for the server's acknowledgments. Unacknowledged readings are
+kept and resent after a reconnect, so none are lost when a connection drops.
+
+Each new connection offers the binary encoding (see protocol.py); readings
+are parsed here into numbers and sent as fixed-size records, so the server
+does no JSON or unit parsing for them. Against a server that does not take
+binary, the connection falls back to JSON.
+
+Readings that cannot be delivered because the server is unreachable go to a
+local spool (see spool.py) and are drained in large batches once it is back.
+Readings that cannot be encoded at all are dropped instead, since no retry
+could ever send them.
+
+A ChangeTracker drops readings whose upstream time has not advanced since the
+last send. On JSON connections it also reduces the rest to deltas, which the
+server merges onto the station's previous reading. Binary readings are already
+smaller than a JSON delta, so binary connections get full readings. Each delta
+keeps the full reading it was made from: if the server had no reading to merge
+it onto, the full reading is sent in its place, and a spooled delta is written
+to the spool in full.
+"""
+import json
+import os
+import re
+import select
+import socket
+import ssl
+import struct
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+import metrics
+from protocol import (BATCH_KEY, SEQ_KEY, BinaryEncoder, FrameError, encode_frame, make_hello, parse_ack_reply,
+                      parse_hello_reply, read_frame)
+from reading import DELTA_KEY, parse_reading, parse_timestamp
+from spool import SPOOL_DIR, Spool
+
+# Readings that may be sent before the oldest one has been acknowledged
+ACK_WINDOW = 64
+
+# Readings packed into one batch document by submit_batch
+BATCH_SIZE = 500
+
+# Encoding asked for on each connection: "binary" (negotiated, JSON fallback) or "json"
+WIRE_ENCODING = "binary"
+
+# With deltas, a full reading is still sent for each station at least this often (seconds)
+FULL_REFRESH_INTERVAL = 3600
+
+# Metrics (see metrics.py; served by start_metrics_server when a client enables it)
+_STAGE_HELP = "Time spent in each stage of the client"
+STAGE_CONNECT = metrics.histogram("weather_client_stage_seconds", _STAGE_HELP, stage="connect")
+STAGE_ENCODE = metrics.histogram("weather_client_stage_seconds", _STAGE_HELP, stage="encode")
+STAGE_SEND = metrics.histogram("weather_client_stage_seconds", _STAGE_HELP, stage="send")
+STAGE_ACK_WAIT = metrics.histogram("weather_client_stage_seconds", _STAGE_HELP, stage="ack_wait")
+HANDSHAKES = {kind: metrics.counter("weather_client_tls_handshakes_total", "TLS handshakes, by kind", kind=kind)
+              for kind in ("full", "resumed")}
+RECONNECTS = metrics.counter("weather_client_reconnects_total", "Reconnects after a connection was lost")
+READINGS_SENT = metrics.counter("weather_client_readings_sent_total", "Readings handed to the server connection")
+READINGS_SPOOLED = metrics.counter("weather_client_readings_spooled_total", "Readings written to the spool")
+READINGS_DROPPED = metrics.counter("weather_client_readings_dropped_total",
+                                   "Readings dropped because no encoding can carry them")
+READINGS_SKIPPED = metrics.counter("weather_client_readings_skipped_total",
+                                   "Readings not sent because upstream had not updated")
+
+# ========== Utility Functions ==========
+
+def debug_print(header, message):
+    """Print debug information with a formatted header"""
+    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    print(f"\n===== {header} [{timestamp}] =====")
+    print(message)
+
+# ========== Persistent Secure Connection ==========
+
+class UnencodableError(ValueError):
+    """A reading or batch that no wire encoding can carry; retrying cannot help"""
+
+# Client TLS contexts, built once per certificate file
+_contexts = {}
+
+def get_client_context(certfile):
+    """Return the cached client context for a server certificate"""
+    context = _contexts.get(certfile)
+    if context is None:
+        debug_print("SSL SETUP", f"Using certificate file: {certfile}")
+        context = _contexts[certfile] = ssl.create_default_context(ssl.Purpose.SERVER_AUTH, cafile=certfile)
+    return context
+
+class StationConnection:
+    """A persistent, framed TLS connection with a window of unacknowledged readings"""
+
+    def __init__(self, server_ip, server_port, certfile, timeout=10, window=ACK_WINDOW, encoding=WIRE_ENCODING):
+        self.server_ip = server_ip
+        self.server_port = server_port
+        self.certfile = certfile
+        self.timeout = timeout
+        self.window = max(1, window)
+        self.encoding = encoding
+        self.sock = None
+        self.binary = None  # BinaryEncoder while the current connection uses the binary encoding
+        self.next_seq = 1
+        self.pending = OrderedDict()  # seq -> document, oldest first
+        self.session = None  # TLS session of the previous connection, offered for resumption
+        self.full_handshakes = 0
+        self.resumed_handshakes = 0
+        self.need_full = set()  # stations whose next reading the server asked to get in full
+
+    def connect(self):
+        context = get_client_context(self.certfile)
+
+        debug_print("SOCKET", f"Connecting to SSL server {self.server_ip}:{self.server_port}...")
+        started = time.perf_counter()
+        raw_sock = socket.create_connection((self.server_ip, self.server_port), timeout=self.timeout)
+        try:
+            self.sock = context.wrap_socket(raw_sock, server_hostname=self.server_ip, session=self.session)
+        except Exception:
+            raw_sock.close()
+            raise
+        STAGE_CONNECT.observe(time.perf_counter() - started)
+        HANDSHAKES["resumed" if self.sock.session_reused else "full"].inc()
+        if self.sock.session_reused:
+            self.resumed_handshakes += 1
+            debug_print("SSL CONNECTION", "SSL session resumed. Secure connection established.")
+        else:
+            self.full_handshakes += 1
+            debug_print("SSL CONNECTION", "SSL handshake successful. Secure connection established.")
+        debug_print("CONNECTION INFO", f"Using cipher: {self.sock.cipher()}")
+
+        self.binary = None
+        if self.encoding == "binary":
+            self.negotiate()
+
+        if self.pending:
+            debug_print("RETRANSMIT", f"Resending {len(self.pending)} unacknowledged reading(s)")
+            self.sock.sendall(b"".join(self.encode(seq, document) for seq, document in self.pending.items()))
+
+    def negotiate(self):
+        """Offer the binary encoding; stay on JSON unless the server accepts it"""
+        self.sock.sendall(encode_frame(make_hello()))
+        payload = read_frame(self.sock)
+        if payload is None:
+            raise ConnectionError("Server closed the connection")
+        if parse_hello_reply(payload) == "binary":
+            self.binary = BinaryEncoder()
+        debug_print("CONNECTION INFO", f"Using {'binary' if self.binary else 'JSON'} encoding")
+
+    def encode(self, seq, document):
+        """
+        Frame for a reading or batch document in the connection's encoding.
+        Falls back to JSON for what the binary encoding cannot carry; raises
+        UnencodableError if JSON cannot carry it either.
+        """
+        started = time.perf_counter()
+        try:
+            items = document[BATCH_KEY] if BATCH_KEY in document else [document]
+            if self.binary is not None and not any(DELTA_KEY in item for item in items):
+                try:
+                    readings = [parse_reading(item) for item in items]
+                except ValueError:
+                    pass  # let the server report what is wrong with it
+                else:
+                    # Extra fields and client-supplied location names only fit in JSON
+                    if not any(reading.extra or reading.location_name for reading in readings):
+                        try:
+                            return encode_frame(self.binary.encode(seq, readings))
+                        except (FrameError, struct.error, OverflowError) as e:
+                            debug_print("ENCODING", f"Sending as JSON, binary cannot carry it: {e}")
+            try:
+                return encode_frame(json.dumps(dict(document, **{SEQ_KEY: seq})))
+            except (TypeError, ValueError, FrameError) as e:
+                raise UnencodableError(str(e)) from e
+        finally:
+            STAGE_ENCODE.observe(time.perf_counter() - started)
+
+    def close(self):
+        if self.sock is not None:
+            try:
+                # TLS 1.3 tickets arrive after the handshake, so pick the session up last
+                self.session = self.sock.session or self.session
+                self.sock.close()
+            finally:
+                self.sock = None
+
+    def _ack_ready(self):
+        return self.sock.pending() > 0 or bool(select.select([self.sock], [], [], 0)[0])
+
+    def _read_acks(self, until_pending):
+        """Consume acknowledgments until at most until_pending readings remain in flight"""
+        block = len(self.pending) > until_pending
+        started = time.perf_counter() if block else None
+        while self.pending and (block or self._ack_ready()):
+            payload = read_frame(self.sock)
+            if payload is None:
+                raise ConnectionError("Server closed the connection")
+            seq, need_full = parse_ack_reply(payload)
+            if seq in self.pending:
+                document = self.pending.pop(seq)
+            elif seq is None:
+                # Plain acks answer frames in the order they were sent
+                document = self.pending.popitem(last=False)[1]
+            else:
+                document = None
+            if need_full:
+                self.need_full.update(need_full)
+                if document is not None:
+                    self._resend_full(document, set(need_full))
+            block = len(self.pending) > until_pending
+        if started is not None:
+            STAGE_ACK_WAIT.observe(time.perf_counter() - started)
+
+    def _resend_full(self, document, station_ids):
+        """
+        Send the full readings behind the deltas of an acknowledged document
+        that the server rejected for lack of an earlier reading of their station
+        """
+        items = document[BATCH_KEY] if BATCH_KEY in document else [document]
+        for item in items:
+            if not isinstance(item, Delta) or str(item.get("station_id")) not in station_ids:
+                continue
+            seq = self.next_seq
+            self.next_seq += 1
+            try:
+                frame = self.encode(seq, item.full)
+            except UnencodableError as e:
+                drop_unencodable(e)
+                continue
+            self.pending[seq] = item.full
+            debug_print("RETRANSMIT", f"Resending the reading of station {item.get('station_id')} in full")
+            self.sock.sendall(frame)
+            READINGS_SENT.inc()
+
+    def _run(self, action):
+        """
+        Run action on a live connection. If a reused connection turns out to be
+        dead, reconnect (which resends everything still unacknowledged) and
+        try once more.
+        """
+        while True:
+            reused = self.sock is not None
+            if not reused:
+                self.connect()
+            try:
+                return action()
+            except (OSError, FrameError):
+                self.close()
+                if not reused:
+                    raise
+                RECONNECTS.inc()
+                debug_print("SOCKET", "Connection was closed by the server. Reconnecting...")
+
+    def submit(self, json_dict):
+        """
+        Queue one reading for delivery and return its sequence number.
+        Only blocks when the window of unacknowledged readings is full.
+        Raises UnencodableError, before anything is queued, for a reading
+        that cannot be encoded.
+        """
+        seq = self.next_seq
+        self.next_seq += 1
+
+        def send_frame():
+            self._read_acks(until_pending=self.window - 1)
+            if seq not in self.pending:
+                frame = self.encode(seq, json_dict)
+                self.pending[seq] = json_dict
+                started = time.perf_counter()
+                self.sock.sendall(frame)
+                STAGE_SEND.observe(time.perf_counter() - started)
+            self._read_acks(until_pending=self.window)
+
+        self._run(send_frame)
+        READINGS_SENT.inc(len(json_dict[BATCH_KEY]) if BATCH_KEY in json_dict else 1)
+        return seq
+
+    def submit_batch(self, readings):
+        """
+        Queue many readings (possibly from several stations) as batch documents
+        of up to BATCH_SIZE readings each; returns their sequence numbers.
+        A batch that cannot be encoded is sent reading by reading instead,
+        dropping the readings that cannot be encoded on their own.
+        """
+        seqs = []
+        for start in range(0, len(readings), BATCH_SIZE):
+            chunk = readings[start:start + BATCH_SIZE]
+            try:
+                seqs.append(self.submit({BATCH_KEY: chunk}))
+            except UnencodableError:
+                for reading in chunk:
+                    try:
+                        seqs.append(self.submit(reading))
+                    except UnencodableError as e:
+                        drop_unencodable(e)
+        return seqs
+
+    def flush(self):
+        """Block until every submitted reading has been acknowledged"""
+        if self.pending:
+            self._run(lambda: self._read_acks(until_pending=0))
+
+    def send(self, json_dict):
+        """Send one reading and wait until everything up to it is acknowledged"""
+        seq = self.submit(json_dict)
+        self.flush()
+        return seq
+
+    def take_need_full(self):
+        """Remove and return the stations the server asked to get a full reading for"""
+        need_full, self.need_full = self.need_full, set()
+        return need_full
+
+    def take_pending(self):
+        """Remove and return the unacknowledged readings, oldest first, with batches unpacked"""
+        readings = []
+        for document in self.pending.values():
+            if BATCH_KEY in document:
+                readings.extend(document[BATCH_KEY])
+            else:
+                readings.append(document)
+        self.pending.clear()
+        return readings
+
+# ========== Change Tracking ==========
+
+class Delta(dict):
+    """A delta document; full is the complete reading it was made from"""
+
+    __slots__ = ("full",)
+
+    def __init__(self, fields, full):
+        super().__init__(fields)
+        self.full = full
+
+class ChangeTracker:
+    """
+    The last reading sent, per station.
+    prepare() returns what to send for a freshly fetched reading: None if its
+    time has not advanced past the last one sent, otherwise the full reading
+    or, with deltas on, only the fields that changed.
+    """
+
+    def __init__(self, deltas=True, full_refresh=FULL_REFRESH_INTERVAL):
+        self.deltas = deltas
+        self.full_refresh = full_refresh
+        self.sent = {}  # station_id -> (last sent document, in full; monotonic time of the last full send)
+        self.skipped = 0
+
+    def prepare(self, document):
+        station_id = document.get("station_id")
+        last = self.sent.get(station_id)
+        if last is not None and document.get("time") and last[0].get("time"):
+            if parse_timestamp(document["time"], 0.0) <= parse_timestamp(last[0]["time"], 0.0):
+                self.skipped += 1
+                READINGS_SKIPPED.inc()
+                return None
+
+        previous = last[0] if last is not None else None
+        now = time.monotonic()
+        if (not self.deltas or previous is None or now - last[1] >= self.full_refresh
+                or any(key not in document for key in previous)):
+            self.sent[station_id] = (document, now)
+            return document
+
+        delta = Delta({key: value for key, value in document.items() if previous.get(key) != value}, document)
+        delta["station_id"] = station_id
+        delta["time"] = document.get("time")
+        delta[DELTA_KEY] = True
+        self.sent[station_id] = (document, last[1])
+        return delta
+
+    def forget(self, station_ids):
+        """Drop what was sent for these stations, so their next reading goes out in full"""
+        for station_id in station_ids:
+            self.sent.pop(station_id, None)
+
+# ========== Spooled Delivery ==========
+
+def drain_spool(connection, spool, in_flight):
+    """Send the spooled backlog oldest first, one acknowledged step at a time"""
+    drained = 0
+    while spool.has_backlog():
+        documents, end = spool.peek()
+        in_flight[:] = documents
+        if documents:
+            connection.submit_batch(documents)
+            connection.flush()
+        spool.consume(end)
+        in_flight.clear()
+        drained += len(documents)
+    if drained:
+        debug_print("SPOOL", f"Delivered {drained} spooled reading(s)")
+
+def drop_unencodable(error):
+    READINGS_DROPPED.inc()
+    debug_print("ERROR", f"Dropped a reading that cannot be encoded: {error}")
+
+def deliver(connection, readings, spool=None, wait_for_ack=False):
+    """
+    Hand readings to the connection. With a spool, any backlog from an outage
+    is drained first, and if the server cannot be reached the readings (plus
+    everything still unacknowledged) are spooled instead of dropped and the
+    error is re-raised. While the spool's backoff delay runs, readings go
+    straight to the spool. Returns True if the readings were sent.
+    Only connection failures spool: a reading that cannot be encoded is
+    dropped, since a spooled copy would fail again at the head of every drain.
+    """
+    if spool is not None and spool.has_backlog() and not spool.backoff.ready():
+        spool.append(readings)
+        READINGS_SPOOLED.inc(len(readings))
+        debug_print("SPOOL", f"{len(readings)} reading(s) spooled until the next retry")
+        return False
+
+    in_flight = []
+    try:
+        if spool is not None:
+            drain_spool(connection, spool, in_flight)
+        if len(readings) == 1:
+            try:
+                connection.submit(readings[0])
+            except UnencodableError as e:
+                drop_unencodable(e)
+                readings = []
+        else:
+            connection.submit_batch(readings)
+        if wait_for_ack:
+            connection.flush()
+    except (OSError, FrameError):
+        # Connection failures (ssl.SSLError and ConnectionError are OSErrors),
+        # or a server that answered with a malformed frame
+        if spool is None:
+            raise
+        # Spooled readings that were in flight are still in the spool file
+        skip = {id(document) for document in in_flight}
+        unsent = [document for document in connection.take_pending() if id(document) not in skip]
+        queued = {id(document) for document in unsent}
+        unsent.extend(document for document in readings if id(document) not in queued)
+        spool.compact()
+        # In full: the delta's base may be gone by the time the spool is drained
+        spool.append([document.full if isinstance(document, Delta) else document for document in unsent])
+        READINGS_SPOOLED.inc(len(unsent))
+        delay = spool.backoff.failed()
+        debug_print("SPOOL", f"Server unreachable: {len(unsent)} reading(s) spooled "
+                    f"({spool.pending_bytes()} bytes in spool), next attempt in {delay:.0f}s")
+        raise
+    if spool is not None:
+        spool.backoff.succeeded()
+    return bool(readings)
+
+def spool_path(name):
+    """Spool file for a station or agent name"""
+    return os.path.join(SPOOL_DIR, re.sub(r"[^\w.-]", "_", str(name)) + ".jsonl")
+
+# One connection per server, kept open between sends
+_connections = {}
+
+# One spool per station
+_spools = {}
+
+# Last fetched and sent readings of the stations sent through send_to_server_secure
+_tracker = ChangeTracker(deltas=WIRE_ENCODING != "binary")
+
+def send_to_server_secure(json_dict, server_ip, server_port, certfile, wait_for_ack=False):
+    """
+    Sends a JSON-formatted dictionary to the server securely using SSL.
+    Readings are pipelined; pass wait_for_ack=True to block until the server
+    has acknowledged everything sent so far. Readings that cannot be delivered
+    are spooled to disk and sent once the server is reachable again. A reading
+    whose time is no newer than the last one sent for its station is skipped.
+    """
+    key = (server_ip, server_port, certfile)
+    connection = _connections.get(key)
+    if connection is None:
+        connection = _connections[key] = StationConnection(server_ip, server_port, certfile)
+    _tracker.forget(connection.take_need_full())
+    document = _tracker.prepare(json_dict)
+    if document is None:
+        debug_print("SKIPPED", f"No new upstream reading since {json_dict.get('time')}; nothing sent.")
+        return
+    try:
+        station_id = json_dict.get("station_id", f"{server_ip}_{server_port}")
+        spool = _spools.get(station_id)
+        if spool is None:
+            spool = _spools[station_id] = Spool(spool_path(station_id))
+
+        if not deliver(connection, [document], spool, wait_for_ack=wait_for_ack):
+            return
+        debug_print("DATA SENT", f"Secure JSON data sent successfully (reading #{connection.next_seq - 1}).")
+        if wait_for_ack:
+            debug_print("SERVER RESPONSE", "All readings acknowledged by the server.")
+        else:
+            debug_print("SERVER RESPONSE", f"{len(connection.pending)} reading(s) awaiting acknowledgment.")
+
+    except ssl.SSLError as ssl_err:
+        debug_print("SSL ERROR", f"SSL error: {ssl_err}")
+    except socket.timeout:
+        debug_print("ERROR", "Socket connection timed out.")
+    except ConnectionRefusedError:
+        debug_print("ERROR", "Connection refused by the server. Is the server running?")
+    except FileNotFoundError:
+        debug_print("ERROR", f"Certificate file '{certfile}' not found.")
+    except Exception as e:
+        debug_print("ERROR", f"Unknown socket/SSL error: {str(e)}")
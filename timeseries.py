@@ -0,0 +1,134 @@
+"""
+Bounded per-station history of readings.
+
+Each station gets a ring buffer of HISTORY_CAPACITY readings stored column by
+column in typed arrays (timestamp, temperature, wind speed, wind direction,
+weather code): about 21 bytes per reading instead of a dict per reading.
+Appending is O(1); window queries return the columns as array slices, so
+reads are done in C rather than element by element. Temperature is in °C and
+wind speed in km/h, as normalised by reading.parse_reading.
+Missing numeric values are stored as NaN and a missing weather code as -1.
+Timestamps only ever increase within a station's history: a reading no newer
+than the station's newest one (a resend or a replayed duplicate) is skipped,
+which keeps the columns sorted for window queries.
+"""
+import threading
+from array import array
+from bisect import bisect_left
+
+# Readings kept per station (one day at one reading per minute)
+HISTORY_CAPACITY = 1440
+
+# Column name -> array typecode
+COLUMNS = {
+    "timestamp": "d",
+    "temperature": "f",
+    "wind_speed": "f",
+    "wind_direction": "f",
+    "weather_code": "b",
+}
+
+NAN = float("nan")
+
+
+class StationHistory:
+    """Fixed-capacity ring buffer of one station's readings"""
+
+    def __init__(self, capacity=HISTORY_CAPACITY):
+        self.capacity = capacity
+        self.columns = {name: array(code, [0]) * capacity for name, code in COLUMNS.items()}
+        self.head = 0  # slot the next reading is written to
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def append(self, timestamp, temperature=NAN, wind_speed=NAN, wind_direction=NAN, weather_code=-1):
+        head = self.head
+        columns = self.columns
+        columns["timestamp"][head] = timestamp
+        columns["temperature"][head] = temperature
+        columns["wind_speed"][head] = wind_speed
+        columns["wind_direction"][head] = wind_direction
+        columns["weather_code"][head] = weather_code
+        self.head = (head + 1) % self.capacity
+        if self.count < self.capacity:
+            self.count += 1
+
+    def _ordered(self, column, start):
+        """Column values from logical position start to the newest, oldest first"""
+        values = self.columns[column]
+        first = (self.head - self.count) % self.capacity
+        begin = first + start
+        end = first + self.count
+        if end <= self.capacity:
+            return values[begin:end]
+        if begin >= self.capacity:
+            return values[begin - self.capacity:end - self.capacity]
+        return values[begin:] + values[:end - self.capacity]
+
+    def window(self, since=None, last=None):
+        """
+        Columns (as arrays, oldest first) for readings with timestamp >= since,
+        or for the last N readings.
+        """
+        start = 0
+        if last is not None:
+            start = max(0, self.count - last)
+        if since is not None:
+            start = max(start, bisect_left(self._ordered("timestamp", 0), since))
+        return {name: self._ordered(name, start) for name in self.columns}
+
+    def newest_time(self):
+        """Timestamp of the newest reading, or None if there is none"""
+        if not self.count:
+            return None
+        return self.columns["timestamp"][(self.head - 1) % self.capacity]
+
+    def latest(self):
+        if not self.count:
+            return None
+        index = (self.head - 1) % self.capacity
+        return {name: values[index] for name, values in self.columns.items()}
+
+
+class HistoryStore:
+    """Station histories by station ID"""
+
+    def __init__(self, capacity=HISTORY_CAPACITY):
+        self.capacity = capacity
+        self._histories = {}
+        self._lock = threading.Lock()
+
+    def record(self, reading):
+        """
+        Append the numeric fields of a reading.Reading to its station's history.
+        Returns False, without appending, if the reading is no newer than the
+        newest one already recorded for the station.
+        """
+        code = reading.weather_code
+        values = (
+            reading.time,
+            NAN if reading.temperature is None else reading.temperature,
+            NAN if reading.wind_speed is None else reading.wind_speed,
+            NAN if reading.wind_direction is None else reading.wind_direction,
+            code if code is not None and -1 <= code <= 127 else -1,
+        )
+        with self._lock:
+            history = self._histories.get(reading.station_id)
+            if history is None:
+                history = self._histories[reading.station_id] = StationHistory(self.capacity)
+            elif history.count and reading.time <= history.newest_time():
+                return False
+            history.append(*values)
+            return True
+
+    def window(self, station_id, since=None, last=None):
+        """Columns for a station's recent readings, or None for an unknown station"""
+        with self._lock:
+            history = self._histories.get(station_id)
+            return history.window(since, last) if history is not None else None
+
+    def stations(self):
+        with self._lock:
+            return list(self._histories)
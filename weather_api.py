@@ -0,0 +1,131 @@
+"""
+Open-Meteo fetch layer shared by the station clients.
+
+All requests go through one pooled keep-alive requests.Session, so repeated
+polls reuse their TCP/TLS connections to api.open-meteo.com instead of paying
+DNS, connect and handshake every time. fetch_concurrently fans a list of
+requests out over a bounded thread pool; a cycle over many coordinates then
+takes about as long as its slowest request rather than the sum of them all.
+
+Open-Meteo refreshes current_weather only every UPSTREAM_INTERVAL seconds;
+next_poll_delay schedules the next poll for just after the next refresh
+instead of polling on a fixed short interval.
+
+Set the OPEN_METEO_URL environment variable to use another endpoint, such as
+the fake upstream in benchmarks/fake_upstream.py.
+"""
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import metrics
+from reading import parse_timestamp
+
+# Open-Meteo endpoint for current conditions
+OPEN_METEO_URL = os.environ.get("OPEN_METEO_URL", "https://api.open-meteo.com/v1/forecast")
+
+# Seconds to wait for Open-Meteo
+FETCH_TIMEOUT = 10
+
+# Requests in flight at once in fetch_concurrently by default; the connection
+# pool grows to the largest concurrency actually used
+FETCH_CONCURRENCY = 8
+
+# How often Open-Meteo refreshes current_weather, and how long after that to poll
+UPSTREAM_INTERVAL = 900
+UPSTREAM_MARGIN = 60
+
+FETCH_SECONDS = metrics.histogram("weather_client_stage_seconds", "Time spent in each stage of the client",
+                                  stage="fetch")
+FETCH_FAILURES = metrics.counter("weather_client_fetch_failures_total", "Failed Open-Meteo requests")
+
+_session = None
+_pool_size = 0
+_session_lock = threading.Lock()
+
+def get_session(pool_size=FETCH_CONCURRENCY):
+    """
+    The shared keep-alive session, created on first use, with room for at
+    least pool_size connections per host. A larger pool_size than before
+    remounts the adapter (its idle connections are dropped once).
+    """
+    global _session, _pool_size
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+        if pool_size > _pool_size:
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+            _session.mount("https://", adapter)
+            _session.mount("http://", adapter)
+            _pool_size = pool_size
+        return _session
+
+def fetch(url, params=None, timeout=FETCH_TIMEOUT):
+    """GET through the shared session, timed; raises requests exceptions for failures and HTTP errors"""
+    started = time.perf_counter()
+    try:
+        response = get_session().get(url, params=params, timeout=timeout)
+        response.raise_for_status()
+        return response
+    except Exception:
+        FETCH_FAILURES.inc()
+        raise
+    finally:
+        FETCH_SECONDS.observe(time.perf_counter() - started)
+
+def fetch_current_weather(latitudes, longitudes):
+    """
+    current_weather blocks for one or more coordinates in a single request.
+    The API takes comma-separated lists and answers with results in the same
+    order (a single object when only one location was asked for).
+    Raises requests exceptions, or ValueError if the answer does not match.
+    """
+    params = {
+        "latitude": ",".join(str(lat) for lat in latitudes),
+        "longitude": ",".join(str(lon) for lon in longitudes),
+        "current_weather": "true",
+    }
+    response = fetch(OPEN_METEO_URL, params=params)
+
+    results = response.json()
+    if isinstance(results, dict):
+        results = [results]
+    if len(results) != len(latitudes):
+        raise ValueError(f"Open-Meteo returned {len(results)} result(s) for {len(latitudes)} location(s)")
+    return [result.get("current_weather", {}) for result in results]
+
+def fetch_concurrently(fetch, items, max_workers=FETCH_CONCURRENCY):
+    """
+    Call fetch(item) for every item with at most max_workers in flight.
+    Returns [(item, result, error)] in the order of items; exactly one of
+    result and error is None.
+    """
+    def attempt(item):
+        try:
+            return item, fetch(item), None
+        except Exception as e:
+            return item, None, e
+
+    items = list(items)
+    if len(items) <= 1 or max_workers <= 1:
+        return [attempt(item) for item in items]
+    # One pooled connection per worker, or the extra ones are discarded after every request
+    get_session(min(max_workers, len(items)))
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(items)), thread_name_prefix="fetch") as pool:
+        return list(pool.map(attempt, items))
+
+def next_poll_delay(time_value, fallback, upstream_interval=UPSTREAM_INTERVAL):
+    """
+    Seconds until the reading stamped time_value is due to be replaced
+    upstream. Falls back to fallback seconds if the time is unknown or the
+    update is already overdue, and never waits less than fallback.
+    """
+    if not time_value:
+        return fallback
+    due = parse_timestamp(time_value, 0.0) + upstream_interval + UPSTREAM_MARGIN
+    delay = due - time.time()
+    return delay if delay > fallback else fallback